@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Benchmark the per-token CPU cost of the websocket wire codec.
+
+Each "token" is one upstream SSE line decoded and re-encoded as a
+response_chunk frame, which is what stream_openai_response does per delta:
+
+    uv run python bench_codec.py --tokens 200000
+"""
+import argparse
+import json
+import time
+import uuid
+
+import codec
+
+SSE_DATA = json.dumps({
+    "id": "chatcmpl-9x0abcdefghijklmnopqrstuvwxyz",
+    "object": "chat.completion.chunk",
+    "created": 1720000000,
+    "model": "gpt-4o-2024-08-06",
+    "system_fingerprint": "fp_abcdef1234",
+    "choices": [{"index": 0, "delta": {"content": " quote"}, "logprobs": None, "finish_reason": None}]
+})
+
+def run_baseline(tokens: int, message_id: str):
+    """Previous path: stdlib json.loads per SSE line, dict per frame, stdlib json.dumps"""
+    for _ in range(tokens):
+        chunk = json.loads(SSE_DATA)
+        content = chunk["choices"][0]["delta"]["content"]
+        json.dumps({"type": "response_chunk", "message_id": message_id, "content": content})
+
+def run_codec(tokens: int, message_id: str, wire_codec):
+    """Codec path: fast JSON decode, pre-encoded envelope (or msgpack) per frame"""
+    envelope = codec.ChunkEnvelope(message_id)
+    for _ in range(tokens):
+        chunk = codec.loads(SSE_DATA)
+        content = chunk["choices"][0]["delta"]["content"]
+        wire_codec.encode_chunk(message_id, content, envelope)
+
+def measure(fn, *args) -> float:
+    started = time.process_time()
+    fn(*args)
+    return time.process_time() - started
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-token CPU cost of the websocket wire codec")
+    parser.add_argument("--tokens", type=int, default=200_000)
+    args = parser.parse_args()
+
+    message_id = str(uuid.uuid4())
+    results = [("stdlib json + dict (before)", measure(run_baseline, args.tokens, message_id))]
+    for name, wire_codec in codec.CODECS.items():
+        label = f"{codec.JSON_BACKEND} + envelope" if name == "json" else f"{codec.JSON_BACKEND} + {name}"
+        results.append((label, measure(run_codec, args.tokens, message_id, wire_codec)))
+
+    baseline = results[0][1]
+    print(f"{args.tokens:,} tokens (JSON backend: {codec.JSON_BACKEND}, msgpack: {'yes' if codec.msgpack else 'no'})")
+    print(f"{'path':<32} {'CPU us/token':>12} {'speed-up':>9}")
+    for label, seconds in results:
+        print(f"{label:<32} {seconds / args.tokens * 1e6:>12.2f} {baseline / seconds:>8.1f}x")
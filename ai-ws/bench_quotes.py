@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark quote pricing and PDF rendering for large multi-line-item quotes.
+
+Prices the same line items with the numpy and pure-Python backends and renders
+the PDF (line table laid out a page at a time) at each size:
+
+    uv run python bench_quotes.py --lines 10 1000 10000
+"""
+import argparse
+import io
+import random
+import time
+
+import pricing
+from main import build_quote_pricing, create_quote_pdf
+
+QUOTE_CONTENT = {
+    "product_description": "Benchmark",
+    "unit_price": 120.0,
+    "terms": "Payment due within 30 days.",
+    "additional_notes": "Benchmark quote."
+}
+
+def make_parameters(lines: int) -> dict:
+    rng = random.Random(lines)
+    return {
+        "customer_name": "Benchmark Corp",
+        "discount": "5%",
+        "tax_rate": "8.25%",
+        "line_items": [
+            {
+                "sku": f"SKU-{i:05d}",
+                "description": f"Enterprise component {i} with extended support",
+                "quantity": str(rng.choice([1, 5, 20, 150, 600, 1200])),
+                "unit_price": f"{rng.uniform(5, 900):.2f}",
+                **({"discount": "12%"} if i % 7 == 0 else {})
+            }
+            for i in range(lines)
+        ]
+    }
+
+def best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quote pricing and PDF rendering benchmark")
+    parser.add_argument("--lines", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5, help="Pricing runs per size (best is reported)")
+    args = parser.parse_args()
+
+    tiers = pricing.parse_tiers("100:5,500:10,1000:15")
+    print(f"pricing backends: {'numpy, ' if pricing.PRICING_BACKEND == 'numpy' else ''}python")
+    print(f"{'lines':>7} {'numpy ms':>9} {'python ms':>10} {'pdf ms':>9} {'pdf KB':>8} {'total':>16}")
+    for lines in args.lines:
+        parameters = make_parameters(lines)
+        items = pricing.LineItems.from_rows(parameters["line_items"], 120.0)
+        timings = {}
+        for backend in ("numpy", "python"):
+            if backend == "numpy" and pricing.PRICING_BACKEND != "numpy":
+                timings[backend] = None
+                continue
+            timings[backend] = best_of(
+                lambda: pricing.price_line_items(items, tiers, 0.05, 0.0825, backend=backend), args.repeat
+            )
+
+        quote_pricing = build_quote_pricing(parameters, QUOTE_CONTENT)
+        output = io.BytesIO()
+        started = time.perf_counter()
+        create_quote_pdf(parameters, QUOTE_CONTENT, quote_pricing, "benchmark-quote-id", output)
+        pdf_seconds = time.perf_counter() - started
+
+        numpy_ms = f"{timings['numpy'] * 1000:.2f}" if timings["numpy"] is not None else "n/a"
+        print(f"{lines:>7,} {numpy_ms:>9} {timings['python'] * 1000:>10.2f} {pdf_seconds * 1000:>9.0f} "
+              f"{len(output.getvalue()) / 1024:>8.0f} {quote_pricing.totals['total']:>16,.2f}")
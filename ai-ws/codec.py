@@ -0,0 +1,94 @@
+"""
+Wire codecs for websocket frames and the upstream SSE reader.
+
+JSON uses orjson when it is installed and falls back to the stdlib. Clients can
+negotiate MessagePack binary frames per connection with ``?codec=msgpack``
+(requires the optional ``msgpack`` package).
+"""
+import json
+from typing import Any, Dict, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional binary framing
+    msgpack = None
+
+JSON_BACKEND = "orjson" if orjson else "json"
+
+if orjson:
+    def dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+
+    def loads(data: Union[str, bytes]) -> Any:
+        return orjson.loads(data)
+else:
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+    def dumps(obj: Any) -> str:
+        return _encoder.encode(obj)
+
+    def loads(data: Union[str, bytes]) -> Any:
+        return json.loads(data)
+
+# Both json.JSONDecodeError and orjson.JSONDecodeError (and msgpack's errors) are ValueErrors
+DecodeError = ValueError
+
+class JsonCodec:
+    """Text frames encoded as JSON"""
+    name = "json"
+    binary = False
+
+    def encode(self, message: Dict) -> str:
+        return dumps(message)
+
+    def decode(self, data: Union[str, bytes]) -> Any:
+        return loads(data)
+
+    def encode_chunk(self, message_id: str, content: str, envelope: Optional["ChunkEnvelope"] = None) -> str:
+        if envelope is None:
+            envelope = ChunkEnvelope(message_id)
+        return envelope.encode(content)
+
+class MsgpackCodec:
+    """Binary frames encoded as MessagePack"""
+    name = "msgpack"
+    binary = True
+
+    def encode(self, message: Dict) -> bytes:
+        return msgpack.packb(message, use_bin_type=True)
+
+    def decode(self, data: Union[str, bytes]) -> Any:
+        if isinstance(data, str):
+            # Clients may still send control messages as JSON text
+            return loads(data)
+        return msgpack.unpackb(data, raw=False)
+
+    def encode_chunk(self, message_id: str, content: str, envelope: Optional["ChunkEnvelope"] = None) -> bytes:
+        return self.encode({"type": "response_chunk", "message_id": message_id, "content": content})
+
+class ChunkEnvelope:
+    """Pre-encoded response_chunk frame for one message: only the content is encoded per token"""
+    __slots__ = ("message_id", "prefix")
+
+    def __init__(self, message_id: str):
+        self.message_id = message_id
+        self.prefix = '{"type":"response_chunk","message_id":' + dumps(message_id) + ',"content":'
+
+    def encode(self, content: str) -> str:
+        return self.prefix + dumps(content) + "}"
+
+JSON_CODEC = JsonCodec()
+CODECS = {"json": JSON_CODEC}
+if msgpack:
+    CODECS["msgpack"] = MsgpackCodec()
+
+def negotiate(requested: Optional[str]):
+    """Codec for a connection's ?codec= value (JSON when absent or unavailable)"""
+    if not requested:
+        return JSON_CODEC
+    return CODECS.get(requested.lower(), JSON_CODEC)
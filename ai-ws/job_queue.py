@@ -0,0 +1,256 @@
+"""
+Durable SQLite-backed queue for tool jobs.
+
+The web service submits jobs and pushes completions to clients; tool workers
+(``worker.py`` processes, or the web process itself in inline mode) claim and
+run them. Claims are lease based, so a job whose worker dies mid-run is picked
+up again once its lease expires.
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+FINISHED_STATES = (JOB_SUCCEEDED, JOB_FAILED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    tool_name TEXT NOT NULL,
+    parameters TEXT NOT NULL,
+    client_id TEXT NOT NULL,
+    message_id TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    worker_id TEXT,
+    lease_expires_at REAL,
+    notified INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_claimable ON jobs(status, created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_unnotified ON jobs(client_id) WHERE notified = 0;
+"""
+
+class JobQueue(SQLiteStore):
+    """Tool job queue stored in a local SQLite database (WAL mode, safe across processes)"""
+    def __init__(self, path: str, lease_seconds: float = 300.0, max_attempts: int = 3):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        super().__init__(path, SCHEMA)
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> Dict:
+        job = dict(row)
+        job["parameters"] = json.loads(job["parameters"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["notified"] = bool(job["notified"])
+        return job
+
+    def submit(self, tool_name: str, parameters: Dict, client_id: str, message_id: Optional[str] = None) -> str:
+        """Persist a new job and return its id"""
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        self._conn().execute(
+            "INSERT INTO jobs (job_id, tool_name, parameters, client_id, message_id, status, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, tool_name, json.dumps(parameters), client_id, message_id, JOB_QUEUED, now, now)
+        )
+        return job_id
+
+    def claim(self, worker_id: str, exclude_tools: Iterable[str] = ()) -> Optional[Dict]:
+        """Atomically take the oldest queued job (or one whose lease expired), skipping exclude_tools"""
+        conn = self._conn()
+        now = time.time()
+        exclude_tools = list(exclude_tools)
+        excluded = f"AND tool_name NOT IN ({','.join('?' * len(exclude_tools))}) " if exclude_tools else ""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            while True:
+                row = conn.execute(
+                    f"SELECT * FROM jobs WHERE (status = ? OR (status = ? AND lease_expires_at < ?)) {excluded}"
+                    "ORDER BY created_at LIMIT 1",
+                    (JOB_QUEUED, JOB_RUNNING, now, *exclude_tools)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                if row["attempts"] >= self.max_attempts:
+                    # Worker kept dying on this job - stop retrying it
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE job_id = ?",
+                        (JOB_FAILED, f"Gave up after {row['attempts']} attempts", now, row["job_id"])
+                    )
+                    continue
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker_id = ?, attempts = attempts + 1, lease_expires_at = ?, updated_at = ? "
+                    "WHERE job_id = ?",
+                    (JOB_RUNNING, worker_id, now + self.lease_seconds, now, row["job_id"])
+                )
+                conn.execute("COMMIT")
+                job = self._row_to_job(row)
+                job["status"] = JOB_RUNNING
+                job["attempts"] += 1
+                return job
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def complete(self, job_id: str, result: Dict):
+        """Store a tool result; the job succeeds or fails based on result['success']"""
+        status = JOB_SUCCEEDED if result.get("success") else JOB_FAILED
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, lease_expires_at = NULL, updated_at = ? WHERE job_id = ?",
+            (status, json.dumps(result), result.get("error"), time.time(), job_id)
+        )
+
+    def fail(self, job_id: str, error: str):
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, error = ?, lease_expires_at = NULL, updated_at = ? WHERE job_id = ?",
+            (JOB_FAILED, error, time.time(), job_id)
+        )
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        row = self._conn().execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def pending_notifications(self, client_ids: Iterable[str], batch_size: int = 500) -> List[Dict]:
+        """Finished jobs not yet pushed to the given (connected) clients"""
+        client_ids = list(client_ids)
+        jobs = []
+        for start in range(0, len(client_ids), batch_size):
+            batch = client_ids[start:start + batch_size]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn().execute(
+                f"SELECT * FROM jobs WHERE notified = 0 AND client_id IN ({placeholders}) "
+                f"AND status IN (?, ?) ORDER BY updated_at",
+                (*batch, *FINISHED_STATES)
+            ).fetchall()
+            jobs.extend(self._row_to_job(row) for row in rows)
+        return jobs
+
+    def claim_notification(self, job_id: str) -> bool:
+        """Atomically take the right to push a job's result; False if another process already did"""
+        cursor = self._conn().execute("UPDATE jobs SET notified = 1 WHERE job_id = ? AND notified = 0", (job_id,))
+        return cursor.rowcount == 1
+
+    def release_notification(self, job_id: str):
+        """Give a claimed notification back so it is retried (the push failed)"""
+        self._conn().execute("UPDATE jobs SET notified = 0 WHERE job_id = ?", (job_id,))
+
+    def purge_finished(self, older_than_seconds: float) -> int:
+        """Delete finished jobs older than the retention window"""
+        cursor = self._conn().execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+            (*FINISHED_STATES, time.time() - older_than_seconds)
+        )
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        rows = self._conn().execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["count"] for row in rows}
+
+class ToolWorker:
+    """Claims jobs from a JobQueue and runs them with bounded concurrency.
+
+    tool_limits caps the jobs of one tool running at once; a tool at its cap is
+    not claimed, so its queued jobs never hold worker slots that other tools could use.
+    """
+    def __init__(self, queue: JobQueue, execute: Callable[[Dict, str], Awaitable[Dict]], worker_id: str,
+                 concurrency: int = 4, poll_interval: float = 0.5,
+                 on_finished: Optional[Callable[[str], None]] = None,
+                 tool_limits: Optional[Dict[str, int]] = None):
+        self.queue = queue
+        self.execute = execute
+        self.worker_id = worker_id
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.on_finished = on_finished
+        self.tool_limits = tool_limits or {}
+        self.running_by_tool: Dict[str, int] = {}
+        self.wakeup = asyncio.Event()
+        self.running_tasks = set()
+        self._stopping = False
+
+    def saturated_tools(self) -> List[str]:
+        """Tools with as many running jobs as their limit allows"""
+        return [name for name, limit in self.tool_limits.items() if self.running_by_tool.get(name, 0) >= limit]
+
+    def notify(self):
+        """Wake the claim loop immediately (used when a job is submitted in-process)"""
+        self.wakeup.set()
+
+    async def run(self):
+        slots = asyncio.Semaphore(self.concurrency)
+        logger.info(f"Tool worker {self.worker_id} started (concurrency {self.concurrency})")
+        while not self._stopping:
+            await slots.acquire()
+            try:
+                job = await asyncio.to_thread(self.queue.claim, self.worker_id, self.saturated_tools())
+            except Exception as e:
+                logger.error(f"Tool worker {self.worker_id} failed to claim a job: {e}")
+                job = None
+
+            if job is None:
+                slots.release()
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Counted before the task starts so the next claim already sees this job
+            tool_name = job["tool_name"]
+            self.running_by_tool[tool_name] = self.running_by_tool.get(tool_name, 0) + 1
+            task = asyncio.create_task(self._run_job(job))
+            self.running_tasks.add(task)
+            task.add_done_callback(self.running_tasks.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+    def _job_done(self, tool_name: str):
+        self.running_by_tool[tool_name] -= 1
+        # A job of this tool may have been skipped while it was at its limit
+        self.wakeup.set()
+
+    async def _run_job(self, job: Dict):
+        try:
+            await self._execute_job(job)
+        finally:
+            self._job_done(job["tool_name"])
+
+    async def _execute_job(self, job: Dict):
+        job_id = job["job_id"]
+        tool_call = {"tool_name": job["tool_name"], "parameters": job["parameters"], "message_id": job["message_id"]}
+        try:
+            result = await self.execute(tool_call, job["client_id"])
+            await asyncio.to_thread(self.queue.complete, job_id, result)
+        except Exception as e:
+            logger.error(f"Job {job_id} ({job['tool_name']}) raised: {e}")
+            await asyncio.to_thread(self.queue.fail, job_id, str(e))
+        if self.on_finished:
+            self.on_finished(job_id)
+
+    def stop_claiming(self):
+        """Stop claiming new jobs; running ones carry on"""
+        self._stopping = True
+        self.wakeup.set()
+
+    async def stop(self, timeout: float):
+        """Stop claiming new jobs and wait for running ones up to the timeout"""
+        self.stop_claiming()
+        if self.running_tasks:
+            await asyncio.wait(self.running_tasks, timeout=timeout)
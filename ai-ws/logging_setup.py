@@ -0,0 +1,158 @@
+"""
+Non-blocking structured logging.
+
+Records are put on a bounded queue by a QueueHandler and formatted and written
+by a QueueListener thread, so the event loop never formats JSON or blocks on
+stderr. Hot-path code logs through log_event(), which checks the level and the
+per-event sample rate before doing any work and passes payloads by reference;
+they are truncated to LOG_PAYLOAD_LIMIT characters on the listener thread.
+"""
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+from typing import Any, Dict, Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # "json" or "text"
+LOG_PAYLOAD_LIMIT = int(os.getenv("LOG_PAYLOAD_LIMIT", "512"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Per-event sample rates, e.g. "ws.message=0.01,tool.detected=0.1" (events not listed are always logged)
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+
+def truncate(value: Any, limit: int = LOG_PAYLOAD_LIMIT) -> Any:
+    """Cap a log field at limit characters; containers are serialised first when too large"""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    text = value if isinstance(value, str) else json.dumps(value, default=str, ensure_ascii=False)
+    if len(text) <= limit:
+        return value
+    return f"{text[:limit]}...(+{len(text) - limit} chars)"
+
+class Sampler:
+    """Deterministic per-event sampling: a rate of 0.01 logs the 1st, 101st, 201st... occurrence"""
+    def __init__(self, rates: Dict[str, float]):
+        self.rates = rates
+        self._counters: Dict[str, itertools.count] = {}
+
+    @staticmethod
+    def parse(spec: str) -> Dict[str, float]:
+        rates = {}
+        for item in spec.split(","):
+            if "=" in item:
+                event, rate = item.split("=", 1)
+                rates[event.strip()] = min(max(float(rate), 0.0), 1.0)
+        return rates
+
+    def rate(self, event: str) -> float:
+        return self.rates.get(event, 1.0)
+
+    def should_log(self, event: str) -> bool:
+        rate = self.rates.get(event, 1.0)
+        if rate >= 1.0:
+            return True
+        if rate <= 0.0:
+            return False
+        counter = self._counters.get(event)
+        if counter is None:
+            counter = self._counters.setdefault(event, itertools.count())
+        return next(counter) % round(1 / rate) == 0
+
+sampler = Sampler(Sampler.parse(LOG_SAMPLE_RATES))
+
+def log_event(logger: logging.Logger, event: str, level: int = logging.INFO, **fields):
+    """Log a structured event if its level is enabled and it is sampled in"""
+    if not logger.isEnabledFor(level) or not sampler.should_log(event):
+        return
+    rate = sampler.rate(event)
+    if rate < 1.0:
+        fields["sample_rate"] = rate
+    logger.log(level, event, extra={"event": event, "fields": fields})
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, event fields and exception text"""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        for key, value in getattr(record, "fields", {}).items():
+            entry[key] = truncate(value)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class TextFormatter(logging.Formatter):
+    """The stdlib "LEVEL:logger:message" line with event fields appended as key=value"""
+    def __init__(self):
+        super().__init__("%(levelname)s:%(name)s:%(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={truncate(value)}" for key, value in fields.items())
+        return line
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records (and counts them) instead of blocking when the queue is full"""
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stdlib version formats the message and traceback here, on the calling thread;
+        # queue the record as-is so the listener's formatter does that work (and emits "exc")
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+queue_handler: Optional[DroppingQueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def setup_logging():
+    """Route the root logger through a bounded queue to a background writer thread (idempotent)"""
+    global queue_handler, _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler()
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(log_queue)
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener.start()
+    atexit.register(stop_logging)
+
+def stop_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def logging_stats() -> Dict:
+    return {
+        "format": LOG_FORMAT,
+        "queued": queue_handler.queue.qsize() if queue_handler else 0,
+        "dropped": queue_handler.dropped if queue_handler else 0,
+        "sample_rates": sampler.rates
+    }
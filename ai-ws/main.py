@@ -1,31 +1,103 @@
 import asyncio
+import functools
+import hashlib
+import hmac
+import importlib
 import json
 import os
+import signal
+import sys
+import tempfile
+import threading
+import time
 import uuid
-from typing import Dict, List
+from email.utils import formatdate, parsedate_to_datetime
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, BinaryIO, Callable, Dict, List, Literal, Optional, Tuple, Union
 from datetime import datetime, timedelta
 import io
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import Depends, FastAPI, Header, WebSocket, WebSocketDisconnect, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, Response
 import httpx
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, field_validator
 import logging
-import xml.etree.ElementTree as ET
 import re
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib import colors
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-from supabase import create_client, Client
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+import codec
+import pricing
+from logging_setup import log_event, logging_stats, setup_logging
+from job_queue import JOB_QUEUED, JobQueue, ToolWorker
+from model_router import ModelRouter
+from tool_registry import TOOL_KIND_CPU, TOOL_KIND_IO, ToolRegistry, ToolSpec
+from quote_index import QuoteIndex
+from workflow_engine import WorkflowError, WorkflowStore, approver_key, is_participant
+
+# ReportLab, the Supabase SDK and ElementTree are imported lazily where they are
+# used (see timed_import); they add roughly half a second to a cold start.
+HEAVY_MODULES = [
+    "xml.etree.ElementTree",
+    "reportlab.platypus",
+    "reportlab.lib.styles",
+    "supabase",
+]
+startup_timings: Dict = {"imports_ms": {}, "warmup_ms": None, "ready": False}
+
+def timed_import(module_name: str):
+    """Import a module (once) and record how long the first import took"""
+    module = sys.modules.get(module_name)
+    if module is None:
+        started = time.perf_counter()
+        module = importlib.import_module(module_name)
+        startup_timings["imports_ms"][module_name] = round((time.perf_counter() - started) * 1000, 1)
+    return module
+
+# Configure logging (JSON lines written by a background thread; see logging_setup)
+setup_logging()
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="AI WebSocket Service", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the job dispatcher (and the in-process tool worker in inline mode)"""
+    global inline_tool_worker
+    background_tasks = []
+    if TOOL_WORKER_MODE == "inline":
+        inline_tool_worker = ToolWorker(
+            tool_queue,
+            execute_tool,
+            worker_id=f"inline-{os.getpid()}",
+            concurrency=TOOL_WORKER_CONCURRENCY,
+            poll_interval=TOOL_QUEUE_POLL_INTERVAL,
+            on_finished=lambda job_id: job_dispatch_wakeup.set(),
+            tool_limits=tool_registry.concurrency_limits()
+        )
+        background_tasks.append(asyncio.create_task(inline_tool_worker.run()))
+    background_tasks.append(asyncio.create_task(job_dispatch_loop()))
+    background_tasks.append(asyncio.create_task(connection_heartbeat_loop()))
+    if SUPABASE_CONFIGURED:
+        background_tasks.append(asyncio.create_task(signed_url_refresh_loop()))
+    else:
+        background_tasks.append(asyncio.create_task(local_pdf_sweep_loop()))
+    install_drain_signal_handlers()
+    
+    # Warm up in the background so the server binds immediately; /health reports 503 until ready
+    if WARMUP_ENABLED:
+        background_tasks.append(asyncio.create_task(warm_up()))
+    else:
+        startup_timings["ready"] = True
+    
+    yield
+    
+    if inline_tool_worker:
+        await inline_tool_worker.stop(timeout=SHUTDOWN_DRAIN_TIMEOUT)
+        inline_tool_worker = None
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    tool_registry.shutdown()
+    await close_http_client()
+
+app = FastAPI(title="AI WebSocket Service", version="1.0.0", lifespan=lifespan)
 
 # CORS middleware to allow connections from the client
 app.add_middleware(
@@ -36,24 +108,122 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Connection liveness configuration
+WS_HEARTBEAT_INTERVAL = float(os.getenv("WS_HEARTBEAT_INTERVAL", "25"))  # server heartbeat frame to quiet sockets
+WS_IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", "600"))  # close sockets with no inbound frames for this long (0 disables)
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))  # a heartbeat or close that blocks this long means the peer is gone
+WS_CLOSE_REPLACED = 4000  # another socket connected with the same client_id
+WS_CLOSE_IDLE = 4001
+
+class ConnectionState:
+    """One websocket and what the server tracks for it (__slots__ keeps it small under churn)"""
+    __slots__ = ("client_id", "websocket", "codec", "connected_at", "last_seen", "last_sent", "tasks", "frames_in", "frames_out")
+    
+    def __init__(self, client_id: str, websocket: WebSocket, wire_codec):
+        now = time.monotonic()
+        self.client_id = client_id
+        self.websocket = websocket
+        self.codec = wire_codec
+        self.connected_at = now
+        self.last_seen = now  # last inbound frame
+        self.last_sent = now  # last outbound frame
+        self.tasks = set()  # in-flight work owned by this connection (the current response stream)
+        self.frames_in = 0
+        self.frames_out = 0
+    
+    def touch(self):
+        self.last_seen = time.monotonic()
+        self.frames_in += 1
+    
+    def start_task(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+    
+    def cancel_tasks(self):
+        for task in list(self.tasks):
+            task.cancel()
+
 # Store active connections
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
+        self.active_connections: Dict[str, ConnectionState] = {}
+        self.draining = False  # set on shutdown: no new sockets are accepted
+        self.replaced = 0
+        self.reaped = 0
+        self.heartbeat_failures = 0
     
-    async def connect(self, websocket: WebSocket, client_id: str):
+    async def connect(self, websocket: WebSocket, client_id: str, wire_codec=codec.JSON_CODEC) -> ConnectionState:
         await websocket.accept()
-        self.active_connections[client_id] = websocket
-        logger.info(f"Client {client_id} connected. Total connections: {len(self.active_connections)}")
+        state = ConnectionState(client_id, websocket, wire_codec)
+        previous = self.active_connections.get(client_id)
+        self.active_connections[client_id] = state
+        if previous is not None:
+            # Newest connection wins: the old socket is usually a half-open one left over from a reconnect
+            self.replaced += 1
+            log_event(logger, "ws.replaced", client_id=client_id)
+            await self.close(previous, WS_CLOSE_REPLACED, "Replaced by a newer connection")
+        log_event(logger, "ws.connect", client_id=client_id, codec=wire_codec.name, connections=len(self.active_connections))
+        return state
+    
+    def disconnect(self, client_id: str, state: Optional[ConnectionState] = None):
+        """Forget a client's connection; with state given, only if it is still the registered one"""
+        current = self.active_connections.get(client_id)
+        if current is None or (state is not None and current is not state):
+            return
+        del self.active_connections[client_id]
+        current.cancel_tasks()
+        log_event(logger, "ws.disconnect", client_id=client_id, frames_in=current.frames_in, frames_out=current.frames_out,
+                  connections=len(self.active_connections))
+    
+    async def close(self, state: ConnectionState, code: int, reason: str):
+        """Unregister a connection, cancel its work and close the socket (best effort)"""
+        self.disconnect(state.client_id, state)
+        state.cancel_tasks()
+        try:
+            await asyncio.wait_for(state.websocket.close(code=code, reason=reason), timeout=WS_SEND_TIMEOUT)
+        except Exception as e:
+            logger.debug(f"Closing socket for {state.client_id} failed: {e}")
     
-    def disconnect(self, client_id: str):
-        if client_id in self.active_connections:
-            del self.active_connections[client_id]
-            logger.info(f"Client {client_id} disconnected. Total connections: {len(self.active_connections)}")
+    async def _send_frame(self, state: ConnectionState, frame):
+        if state.codec.binary:
+            await state.websocket.send_bytes(frame)
+        else:
+            await state.websocket.send_text(frame)
+        state.last_sent = time.monotonic()
+        state.frames_out += 1
+    
+    async def send_message(self, message: Dict, client_id: str):
+        """Encode a frame with the client's negotiated codec and send it"""
+        state = self.active_connections.get(client_id)
+        if state is not None:
+            await self._send_frame(state, state.codec.encode(message))
+    
+    async def send_chunk(self, envelope: codec.ChunkEnvelope, content: str, client_id: str):
+        """Send a response_chunk frame using the stream's pre-encoded envelope"""
+        state = self.active_connections.get(client_id)
+        if state is not None:
+            await self._send_frame(state, state.codec.encode_chunk(envelope.message_id, content, envelope))
     
-    async def send_personal_message(self, message: str, client_id: str):
-        if client_id in self.active_connections:
-            await self.active_connections[client_id].send_text(message)
+    async def heartbeat(self, state: ConnectionState) -> bool:
+        """Send a heartbeat frame; False if the socket is gone or the send stalls"""
+        try:
+            await asyncio.wait_for(self._send_frame(state, state.codec.encode({"type": "heartbeat"})), timeout=WS_SEND_TIMEOUT)
+            return True
+        except Exception:
+            return False
+    
+    def snapshot(self) -> Dict:
+        now = time.monotonic()
+        return {
+            "active": len(self.active_connections),
+            "streaming": sum(1 for state in self.active_connections.values() if state.tasks),
+            "max_idle_seconds": round(max((now - state.last_seen for state in self.active_connections.values()), default=0.0), 1),
+            "replaced": self.replaced,
+            "reaped": self.reaped,
+            "heartbeat_failures": self.heartbeat_failures
+        }
 
 manager = ConnectionManager()
 
@@ -68,32 +238,435 @@ class OpenAIRequest(BaseModel):
     messages: List[Dict[str, str]]
     stream: bool = True
 
+class SignedUrlRequest(BaseModel):
+    quote_ids: List[str]
+
+# Tool parameter schemas (validated by the tool registry before a tool runs)
+class QuantityParams(BaseModel):
+    model_config = ConfigDict(extra="allow")
+    
+    quantity: Optional[str] = None
+    
+    @field_validator("quantity", mode="before")
+    @classmethod
+    def parse_quantity(cls, value):
+        """Accept "100", "100 seats" or "1,000 units" and keep just the number"""
+        if value is None or isinstance(value, (int, float)):
+            return None if value is None else str(value)
+        match = re.search(r"\d[\d,]*(?:\.\d+)?", str(value))
+        if not match:
+            raise ValueError(f"no number in quantity {value!r}")
+        return match.group(0).replace(",", "")
+
+class LineItemParams(QuantityParams):
+    sku: Optional[str] = None
+    description: Optional[str] = None
+    unit_price: Optional[str] = None
+    discount: Optional[str] = None
+
+class GenerateQuoteParams(QuantityParams):
+    customer_name: Optional[str] = None
+    quote_name: Optional[str] = None
+    product: Optional[str] = None
+    discount: Optional[str] = None
+    tax_rate: Optional[str] = None
+    requirements: Optional[str] = None
+    line_items: Optional[List[LineItemParams]] = None
+
+class WorkflowDecisionRequest(BaseModel):
+    decision: Literal["approve", "reject"]
+    comment: Optional[str] = None
+
+class ApprovalFlowParams(BaseModel):
+    model_config = ConfigDict(extra="allow")
+    
+    flow_name: Optional[str] = None
+    description: Optional[str] = None
+    approvers: Optional[str] = None
+    steps: Optional[str] = None
+
 # OpenAI API configuration
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     logger.warning("OPENAI_API_KEY not found in environment variables")
 
 OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
+OPENAI_MODELS_URL = "https://api.openai.com/v1/models"
+
+# Shared HTTP client so upstream TLS connections are reused across requests
+http_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared upstream HTTP client, creating it on first use"""
+    global http_client
+    if http_client is None or http_client.is_closed:
+        http_client = httpx.AsyncClient(
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=50, keepalive_expiry=60.0)
+        )
+    return http_client
+
+async def close_http_client():
+    global http_client
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+
+# Startup warm-up configuration
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_UPSTREAM_CONNECTIONS = int(os.getenv("WARMUP_UPSTREAM_CONNECTIONS", "2"))
+
+# Upstream retry / hedging configuration (applies until the first token arrives)
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+OPENAI_RETRY_BACKOFF = float(os.getenv("OPENAI_RETRY_BACKOFF", "0.5"))
+OPENAI_FIRST_TOKEN_TIMEOUT = float(os.getenv("OPENAI_FIRST_TOKEN_TIMEOUT", "15"))
+OPENAI_HEDGE_ENABLED = os.getenv("OPENAI_HEDGE_ENABLED", "false").lower() == "true"
+OPENAI_HEDGE_DELAY = float(os.getenv("OPENAI_HEDGE_DELAY", "2.0"))  # used until enough samples exist
+OPENAI_HEDGE_MIN_SAMPLES = 20
+OPENAI_RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+class UpstreamStatusError(Exception):
+    """Raised when OpenAI answers a streaming request with a non-200 status"""
+    def __init__(self, status_code: int, body: bytes):
+        super().__init__(f"OpenAI API error: {status_code}")
+        self.status_code = status_code
+        self.body = body
+
+class UpstreamStats:
+    """Time-to-first-token samples and retry/hedge counters for OpenAI streams"""
+    def __init__(self, window: int = 200):
+        self.ttft_samples = deque(maxlen=window)
+        self.streams = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failures = 0
+    
+    def record_first_token(self, seconds: float):
+        self.streams += 1
+        self.ttft_samples.append(seconds)
+    
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.ttft_samples:
+            return None
+        ordered = sorted(self.ttft_samples)
+        return ordered[min(len(ordered) - 1, int(pct * len(ordered)))]
+    
+    def hedge_delay(self) -> float:
+        """Delay before a duplicate request is started: observed p95 TTFT once warmed up"""
+        if len(self.ttft_samples) < OPENAI_HEDGE_MIN_SAMPLES:
+            return OPENAI_HEDGE_DELAY
+        return self.percentile(0.95)
+    
+    def snapshot(self) -> Dict:
+        p50 = self.percentile(0.5)
+        p95 = self.percentile(0.95)
+        return {
+            "streams": self.streams,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "failures": self.failures,
+            "ttft_p50_ms": round(p50 * 1000) if p50 is not None else None,
+            "ttft_p95_ms": round(p95 * 1000) if p95 is not None else None,
+            "hedge_delay_ms": round(self.hedge_delay() * 1000) if OPENAI_HEDGE_ENABLED else None
+        }
+
+upstream_stats = UpstreamStats()
+
+# Model routing configuration: comma-separated model tiers per call site, tried in order
+CHAT_MODELS = [m.strip() for m in os.getenv("CHAT_MODELS", "gpt-4o").split(",") if m.strip()]
+QUOTE_CONTENT_MODELS = [m.strip() for m in os.getenv("QUOTE_CONTENT_MODELS", "gpt-4o-mini,gpt-4o").split(",") if m.strip()]
+# Room for tool calls with many <item> rows; larger quotes go through POST /quotes instead of the LLM
+CHAT_MAX_TOKENS = int(os.getenv("CHAT_MAX_TOKENS", "4096"))
+CHAT_LATENCY_BUDGET = float(os.getenv("CHAT_LATENCY_BUDGET", "5"))  # p90 seconds to first token
+QUOTE_CONTENT_LATENCY_BUDGET = float(os.getenv("QUOTE_CONTENT_LATENCY_BUDGET", "8"))  # p90 seconds; also the per-attempt timeout
+MODEL_ERROR_BUDGET = float(os.getenv("MODEL_ERROR_BUDGET", "0.2"))  # error rate over the recent window
+MODEL_FAILURE_THRESHOLD = int(os.getenv("MODEL_FAILURE_THRESHOLD", "3"))  # consecutive failures before a cool-down
+MODEL_COOLDOWN = float(os.getenv("MODEL_COOLDOWN", "60"))
+
+model_router = ModelRouter(
+    routes={"chat": CHAT_MODELS, "quote_content": QUOTE_CONTENT_MODELS},
+    latency_budgets={"chat": CHAT_LATENCY_BUDGET, "quote_content": QUOTE_CONTENT_LATENCY_BUDGET},
+    error_budget=MODEL_ERROR_BUDGET,
+    failure_threshold=MODEL_FAILURE_THRESHOLD,
+    cooldown=MODEL_COOLDOWN
+)
+
+# Response cache configuration (opt-in exact-match cache for tool-free answers)
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_REPLAY_CHUNK_SIZE = int(os.getenv("RESPONSE_CACHE_REPLAY_CHUNK_SIZE", "24"))
+RESPONSE_CACHE_REPLAY_DELAY = float(os.getenv("RESPONSE_CACHE_REPLAY_DELAY", "0.01"))
+
+class ResponseCache:
+    """LRU + TTL cache of completed assistant answers keyed by prompt version and conversation"""
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: OrderedDict[str, Tuple[float, str]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+    
+    @staticmethod
+    def make_key(system_prompt: str, model: str, messages: List[Dict[str, str]]) -> str:
+        """Hash the system prompt version plus the whitespace/case-normalized conversation"""
+        prompt_version = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+        conversation = [[m.get("role", ""), " ".join(m.get("content", "").split()).casefold()] for m in messages]
+        raw = json.dumps([prompt_version, model, conversation], separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        stored_at, content = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return content
+    
+    def put(self, key: str, content: str):
+        self.entries[key] = (time.monotonic(), content)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+    
+    def snapshot(self) -> Dict:
+        return {
+            "enabled": RESPONSE_CACHE_ENABLED,
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypasses": self.bypasses
+        }
+
+response_cache = ResponseCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL)
+
+# Tool job queue configuration
+TOOL_QUEUE_PATH = os.getenv("TOOL_QUEUE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "tool_jobs.db"))
+TOOL_WORKER_MODE = os.getenv("TOOL_WORKER_MODE", "inline")  # "inline" runs jobs in this process, "external" leaves them to worker.py
+TOOL_WORKER_CONCURRENCY = int(os.getenv("TOOL_WORKER_CONCURRENCY", "4"))
+TOOL_JOB_LEASE_SECONDS = float(os.getenv("TOOL_JOB_LEASE_SECONDS", "300"))
+TOOL_QUEUE_POLL_INTERVAL = float(os.getenv("TOOL_QUEUE_POLL_INTERVAL", "0.25"))
+TOOL_JOB_RETENTION_SECONDS = float(os.getenv("TOOL_JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+tool_queue = JobQueue(TOOL_QUEUE_PATH, lease_seconds=TOOL_JOB_LEASE_SECONDS)
+
+# Tool execution configuration: CPU-bound steps (PDF rendering) get their own small pool so they
+# cannot starve IO-bound tools; timeouts stay below TOOL_JOB_LEASE_SECONDS
+TOOL_CPU_WORKERS = int(os.getenv("TOOL_CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+TOOL_IO_WORKERS = int(os.getenv("TOOL_IO_WORKERS", "16"))
+QUOTE_TOOL_TIMEOUT = float(os.getenv("QUOTE_TOOL_TIMEOUT", "120"))
+QUOTE_TOOL_MAX_CONCURRENCY = int(os.getenv("QUOTE_TOOL_MAX_CONCURRENCY", "2"))
+APPROVAL_TOOL_TIMEOUT = float(os.getenv("APPROVAL_TOOL_TIMEOUT", "30"))
+APPROVAL_TOOL_MAX_CONCURRENCY = int(os.getenv("APPROVAL_TOOL_MAX_CONCURRENCY", "8"))
+
+tool_registry = ToolRegistry(cpu_workers=TOOL_CPU_WORKERS, io_workers=TOOL_IO_WORKERS)
+
+# Approval workflow store
+WORKFLOW_DB_PATH = os.getenv("WORKFLOW_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "workflows.db"))
+
+workflow_store = WorkflowStore(WORKFLOW_DB_PATH)
+inline_tool_worker: Optional[ToolWorker] = None
+job_dispatch_wakeup = asyncio.Event()
+
+# Graceful shutdown configuration
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "25"))
+pending_tool_tasks = set()
+drain_tasks = set()  # strong references so a running drain is not garbage-collected
+
+# Local PDF storage configuration (used when Supabase is not configured)
+LOCAL_PDF_DIR = os.getenv("LOCAL_PDF_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "temp_pdfs"))
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "http://localhost:8000").rstrip("/")
+DOWNLOAD_URL_TTL = int(os.getenv("DOWNLOAD_URL_TTL", "3600"))
+LOCAL_PDF_TTL = float(os.getenv("LOCAL_PDF_TTL", str(24 * 3600)))
+LOCAL_PDF_MAX_BYTES = int(os.getenv("LOCAL_PDF_MAX_BYTES", str(512 * 1024 * 1024)))
+LOCAL_PDF_SWEEP_INTERVAL = float(os.getenv("LOCAL_PDF_SWEEP_INTERVAL", "300"))
+QUOTE_SPOOL_DIR = os.getenv("QUOTE_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "ai-ws-quotes"))
+SAFE_FILENAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*\.pdf$")
+
+# Used when DOWNLOAD_SIGNING_SECRET is unset: generated once and shared by every process on this host
+DOWNLOAD_SECRET_PLACEHOLDER = "change_me_to_a_long_random_string"  # the env.example value, never a valid key
+if os.getenv("DOWNLOAD_SIGNING_SECRET") == DOWNLOAD_SECRET_PLACEHOLDER:
+    raise RuntimeError("DOWNLOAD_SIGNING_SECRET is still the env.example placeholder; set a real secret or leave it unset")
+DOWNLOAD_SECRET_PATH = os.getenv("DOWNLOAD_SECRET_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".download_secret"))
+
+def load_download_signing_secret() -> bytes:
+    """DOWNLOAD_SIGNING_SECRET, or a random secret persisted at DOWNLOAD_SECRET_PATH.
+
+    Web workers and worker.py processes must sign with the same key, so the
+    generated secret is written once (atomically, first process wins) and read by all.
+    """
+    secret = os.getenv("DOWNLOAD_SIGNING_SECRET", "")
+    if secret:
+        return secret.encode("utf-8")
+    if not os.path.exists(DOWNLOAD_SECRET_PATH):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(DOWNLOAD_SECRET_PATH) or ".", prefix=".download_secret.")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(os.urandom(32).hex())
+            os.link(tmp_path, DOWNLOAD_SECRET_PATH)  # fails if another process got there first
+            logger.warning(f"DOWNLOAD_SIGNING_SECRET not set; generated one at {DOWNLOAD_SECRET_PATH}")
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+    with open(DOWNLOAD_SECRET_PATH) as f:
+        return f.read().strip().encode("utf-8")
+
+_download_signing_secret: Optional[bytes] = None
+
+def get_download_signing_secret() -> bytes:
+    """The download signing key, resolved on the first local sign or download.
+
+    Only local storage signs /download links, so importing main (worker.py, the
+    benchmarks, Supabase deployments) never reads or writes DOWNLOAD_SECRET_PATH.
+    """
+    global _download_signing_secret
+    if _download_signing_secret is None:
+        _download_signing_secret = load_download_signing_secret()
+    return _download_signing_secret
+
+# HTTP API keys, "principal:key,principal:key". A key's principal is the client_id whose quotes and
+# jobs it can read (the id its websocket connects with) and the approver name it decides workflow
+# steps as; the HTTP API is closed while this is unset
+API_KEYS = os.getenv("API_KEYS", "")
+
+def parse_api_keys(spec: str) -> Dict[str, str]:
+    """sha256(key) -> principal; keys are looked up by digest so the lookup does not leak key bytes"""
+    principals = {}
+    for item in spec.split(","):
+        principal, _, key = item.partition(":")
+        if principal.strip() and key.strip():
+            principals[hashlib.sha256(key.strip().encode("utf-8")).hexdigest()] = principal.strip()
+    return principals
+
+API_KEY_PRINCIPALS = parse_api_keys(API_KEYS)
+
+def require_principal(authorization: Optional[str] = Header(None)) -> str:
+    """FastAPI dependency: the principal of the `Authorization: Bearer <key>` header"""
+    if not API_KEY_PRINCIPALS:
+        raise HTTPException(status_code=503, detail="The HTTP API is disabled: API_KEYS is not configured")
+    scheme, _, key = (authorization or "").partition(" ")
+    principal = None
+    if scheme.lower() == "bearer" and key.strip():
+        principal = API_KEY_PRINCIPALS.get(hashlib.sha256(key.strip().encode("utf-8")).hexdigest())
+    if principal is None:
+        raise HTTPException(status_code=401, detail="Invalid or missing API key", headers={"WWW-Authenticate": "Bearer"})
+    return principal
+
+# Signed URL cache configuration (Supabase storage)
+SIGNED_URL_TTL = int(os.getenv("SIGNED_URL_TTL", "3600"))
+SIGNED_URL_REFRESH_MARGIN = float(os.getenv("SIGNED_URL_REFRESH_MARGIN", "300"))
+SIGNED_URL_CACHE_MAX_ENTRIES = int(os.getenv("SIGNED_URL_CACHE_MAX_ENTRIES", "10000"))
+SIGNED_URL_BATCH_SIZE = 500
+QUOTE_ID_RE = re.compile(r"^[0-9a-fA-F-]{36}$")
+
+class SignedUrlCache:
+    """Signed URLs keyed by object path, considered stale SIGNED_URL_REFRESH_MARGIN before expiry"""
+    def __init__(self, max_entries: int, refresh_margin: float):
+        self.max_entries = max_entries
+        self.refresh_margin = refresh_margin
+        # path -> (expires_at, last_used, url)
+        self.entries: OrderedDict[str, Tuple[float, float, str]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.signing_requests = 0
+        self.refreshed = 0
+    
+    def get(self, path: str) -> Optional[Tuple[str, float]]:
+        """(url, expires_at) for a URL that is not about to expire"""
+        entry = self.entries.get(path)
+        now = time.time()
+        if entry is None or entry[0] - now <= self.refresh_margin:
+            self.misses += 1
+            return None
+        self.entries[path] = (entry[0], now, entry[2])
+        self.entries.move_to_end(path)
+        self.hits += 1
+        return entry[2], entry[0]
+    
+    def put(self, path: str, url: str, expires_at: float, touch: bool = True):
+        previous = self.entries.get(path)
+        # Background refreshes keep the old last_used so unused URLs eventually stop being re-signed
+        last_used = previous[1] if previous is not None and not touch else time.time()
+        self.entries[path] = (expires_at, last_used, url)
+        self.entries.move_to_end(path)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+    
+    def due_for_refresh(self, horizon: float) -> List[str]:
+        """Paths used within their lifetime that expire within refresh_margin + horizon seconds"""
+        now = time.time()
+        return [
+            path for path, (expires_at, last_used, _) in self.entries.items()
+            if expires_at - now <= self.refresh_margin + horizon and now - last_used < SIGNED_URL_TTL
+        ]
+    
+    def snapshot(self) -> Dict:
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "signing_requests": self.signing_requests,
+            "refreshed": self.refreshed
+        }
+
+signed_url_cache = SignedUrlCache(SIGNED_URL_CACHE_MAX_ENTRIES, SIGNED_URL_REFRESH_MARGIN)
+
+# Quote index (SQLite): every generated quote with its customer, totals and storage object path
+QUOTE_INDEX_PATH = os.getenv("QUOTE_INDEX_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "quotes.db"))
+
+quote_index = QuoteIndex(QUOTE_INDEX_PATH)
+
+# Quote pricing and layout configuration
+QUOTE_DISCOUNT_TIERS = pricing.parse_tiers(os.getenv("QUOTE_DISCOUNT_TIERS", ""))  # volume tiers, e.g. "100:5,500:10,1000:15"
+QUOTE_TAX_RATE = pricing.parse_rate(os.getenv("QUOTE_TAX_RATE", "0")) or 0.0  # percent, used when the tool call gives no tax_rate
+QUOTE_MAX_LINE_ITEMS = int(os.getenv("QUOTE_MAX_LINE_ITEMS", "20000"))
+QUOTE_WRAP_DESCRIPTION_ROWS = 50  # quotes up to this size get wrapped descriptions; larger ones single-line rows
 
 # Supabase configuration
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
-if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
+SUPABASE_CONFIGURED = bool(SUPABASE_URL and SUPABASE_SERVICE_KEY)
+if not SUPABASE_CONFIGURED:
     logger.warning("Supabase configuration not found in environment variables")
-    supabase_client = None
-else:
-    supabase_client: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+supabase_client = None
+
+def get_supabase_client():
+    """Build the Supabase client on first use (None when Supabase is not configured)"""
+    global supabase_client
+    if supabase_client is None and SUPABASE_CONFIGURED:
+        supabase = timed_import("supabase")
+        supabase_client = supabase.create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+    return supabase_client
+
+# (mtime, content) of the last prompt.txt read, so the file is only re-read when it changes
+_system_prompt_cache: Optional[Tuple[float, str]] = None
 
 def load_system_prompt() -> str:
     """Load the system prompt from prompt.txt file"""
+    global _system_prompt_cache
     try:
         # Get the directory where this script is located
         script_dir = os.path.dirname(os.path.abspath(__file__))
         prompt_path = os.path.join(script_dir, "prompt.txt")
         
+        mtime = os.stat(prompt_path).st_mtime
+        if _system_prompt_cache and _system_prompt_cache[0] == mtime:
+            return _system_prompt_cache[1]
+        
         with open(prompt_path, "r", encoding="utf-8") as f:
             content = f.read().strip()
             logger.info(f"Loaded system prompt from {prompt_path} ({len(content)} characters)")
+            _system_prompt_cache = (mtime, content)
             return content
     except FileNotFoundError:
         logger.warning(f"prompt.txt file not found at {prompt_path}, using default prompt")
@@ -102,8 +675,18 @@ def load_system_prompt() -> str:
         logger.error(f"Error loading prompt.txt: {e}")
         return "You are a helpful AI assistant."
 
+def xml_param_value(elem) -> Union[str, List, Dict]:
+    """Text of a leaf element; a list when all children share a tag (<line_items><item>...), otherwise a dict"""
+    children = list(elem)
+    if not children:
+        return (elem.text or "").strip()
+    if len({child.tag for child in children}) == 1 and (len(children) > 1 or len(children[0])):
+        return [xml_param_value(child) for child in children]
+    return {child.tag: xml_param_value(child) for child in children}
+
 def extract_tool_calls(text: str) -> List[Dict]:
     """Extract XML tool calls from the response text"""
+    ET = timed_import("xml.etree.ElementTree")
     tool_calls = []
     
     # Find all COMPLETE tool_call XML blocks
@@ -125,10 +708,10 @@ def extract_tool_calls(text: str) -> List[Dict]:
                     'parameters': {}
                 }
                 
-                # Extract all parameters
+                # Extract all parameters (nested elements such as <line_items> become lists/dicts)
                 for param in parameters_elem:
-                    if param.text:
-                        tool_call['parameters'][param.tag] = param.text.strip()
+                    if len(param) or param.text:
+                        tool_call['parameters'][param.tag] = xml_param_value(param)
                 
                 tool_calls.append(tool_call)
                 
@@ -138,8 +721,70 @@ def extract_tool_calls(text: str) -> List[Dict]:
     
     return tool_calls
 
+class QuoteContent(BaseModel):
+    """Quote content the LLM must return; a response that fails validation counts as a model failure"""
+    product_description: str
+    unit_price: float
+    total_price: Optional[float] = None
+    terms: str = "Standard terms and conditions apply."
+    additional_notes: Optional[str] = None
+    
+    @field_validator("unit_price", "total_price", mode="before")
+    @classmethod
+    def parse_price(cls, value):
+        """Accept 199, "199.00" or "$1,990.00" and keep just the number"""
+        if value is None or isinstance(value, (int, float)):
+            return value
+        return str(value).replace("$", "").replace(",", "").strip()
+    
+    @field_validator("unit_price")
+    @classmethod
+    def check_unit_price(cls, value):
+        if not 0 < value < 1_000_000:
+            raise ValueError(f"unit_price {value} out of range")
+        return value
+    
+    @field_validator("product_description")
+    @classmethod
+    def check_description(cls, value):
+        if not value.strip():
+            raise ValueError("empty product_description")
+        return value.strip()
+
+def parse_quote_content(content: str) -> Dict:
+    """Validate an LLM quote response; raises ValueError when it is not usable"""
+    # Clean the content - sometimes LLM adds markdown formatting
+    clean_content = content.strip()
+    if clean_content.startswith('```json'):
+        clean_content = clean_content.replace('```json', '').replace('```', '').strip()
+    elif clean_content.startswith('```'):
+        clean_content = clean_content.replace('```', '').strip()
+    return QuoteContent.model_validate(json.loads(clean_content)).model_dump(exclude_none=True)
+
+def fallback_quote_content(parameters: Dict) -> Dict:
+    """Default content used when no model produced a valid response"""
+    # Calculate prices manually with realistic values
+    quantity = float(parameters.get('quantity', 1))
+    unit_price = 199.0  # More reasonable base price
+    discount_pct = 0
+    if parameters.get('discount'):
+        try:
+            discount_pct = float(parameters.get('discount', '0').replace('%', '')) / 100
+        except ValueError:
+            discount_pct = 0
+    
+    total_price = quantity * unit_price * (1 - discount_pct)
+    
+    return {
+        "product_description": f"Professional {parameters.get('product', 'Software License')} designed for enterprise organizations. Includes standard features and basic support.",
+        "unit_price": unit_price,
+        "total_price": total_price,
+        "terms": "Payment due within 30 days. One year warranty included.",
+        "additional_notes": "Professional implementation support available. Regular updates included in first year."
+    }
+
 async def generate_quote_content_with_llm(parameters: Dict) -> Dict:
-    """Use LLM to generate detailed quote content"""
+    """Use LLM to generate detailed quote content, falling back across the quote_content model tiers"""
     if not OPENAI_API_KEY:
         return {
             "product_description": parameters.get('product', 'Product'),
@@ -148,10 +793,16 @@ async def generate_quote_content_with_llm(parameters: Dict) -> Dict:
             "terms": "Standard terms and conditions apply."
         }
     
+    line_items = parameters.get('line_items') or []
+    products = parameters.get('product', 'Software License')
+    if line_items:
+        sample = "; ".join(f"{item.get('quantity', '1')} x {item.get('description') or item.get('sku', 'item')}" for item in line_items[:10])
+        products = f"{len(line_items)} line items ({sample}{'; ...' if len(line_items) > 10 else ''})"
+    
     prompt = f"""
     Generate a realistic business quote for the following request:
     - Customer: {parameters.get('customer_name', 'Customer')}
-    - Product: {parameters.get('product', 'Software License')}
+    - Product: {products}
     - Quantity: {parameters.get('quantity', '1')}
     - Discount: {parameters.get('discount', 'None')}
     - Requirements: {parameters.get('requirements', 'Standard requirements')}
@@ -172,61 +823,39 @@ async def generate_quote_content_with_llm(parameters: Dict) -> Dict:
             "Content-Type": "application/json"
         }
         
-        payload = {
-            "model": "gpt-4o",
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.3,
-            "max_tokens": 500
-        }
+        client = get_http_client()
+        models = model_router.candidates("quote_content")
+        for attempt, model in enumerate(models):
+            payload = {
+                "model": model,
+                "messages": [{"role": "user", "content": prompt}],
+                "response_format": {"type": "json_object"},
+                "temperature": 0.3,
+                "max_tokens": 500
+            }
+            last_attempt = attempt == len(models) - 1
+            # Earlier tiers get the latency budget; the last one gets the client default rather than giving up
+            timeout = httpx.USE_CLIENT_DEFAULT if last_attempt else QUOTE_CONTENT_LATENCY_BUDGET
+            content = ""
+            started = time.perf_counter()
+            try:
+                response = await client.post(OPENAI_API_URL, json=payload, headers=headers, timeout=timeout)
+                if response.status_code != 200:
+                    raise UpstreamStatusError(response.status_code, response.content)
+                content = response.json()['choices'][0]['message']['content']
+                quote_data = parse_quote_content(content)
+            except (UpstreamStatusError, httpx.HTTPError, ValueError, KeyError, IndexError, TypeError) as e:
+                model_router.record(model, time.perf_counter() - started, ok=False)
+                if not last_attempt:
+                    model_router.fallbacks += 1
+                log_event(logger, "model.failed", logging.WARNING, call_site="quote_content", model=model,
+                          error=repr(e), content=content, fallback=None if last_attempt else models[attempt + 1])
+                continue
+            model_router.record(model, time.perf_counter() - started, ok=True)
+            return quote_data
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(OPENAI_API_URL, json=payload, headers=headers)
-            if response.status_code == 200:
-                result = response.json()
-                content = result['choices'][0]['message']['content']
-                
-                # Try to parse JSON from the response
-                try:
-                    import json
-                    # Clean the content - sometimes LLM adds markdown formatting
-                    clean_content = content.strip()
-                    if clean_content.startswith('```json'):
-                        clean_content = clean_content.replace('```json', '').replace('```', '').strip()
-                    elif clean_content.startswith('```'):
-                        clean_content = clean_content.replace('```', '').strip()
-                    
-                    quote_data = json.loads(clean_content)
-                    
-                    # Validate required fields and convert strings to numbers if needed
-                    if 'unit_price' in quote_data:
-                        quote_data['unit_price'] = float(str(quote_data['unit_price']).replace('$', '').replace(',', ''))
-                    if 'total_price' in quote_data:
-                        quote_data['total_price'] = float(str(quote_data['total_price']).replace('$', '').replace(',', ''))
-                    
-                    return quote_data
-                except (json.JSONDecodeError, ValueError, KeyError) as e:
-                    # Fallback if JSON parsing fails
-                    logger.warning(f"Failed to parse LLM response as JSON ({e}), using fallback. Content: {content[:200]}...")
-                    
-                    # Calculate prices manually with realistic values
-                    quantity = float(parameters.get('quantity', 1))
-                    unit_price = 199.0  # More reasonable base price
-                    discount_pct = 0
-                    if parameters.get('discount'):
-                        try:
-                            discount_pct = float(parameters.get('discount', '0').replace('%', '')) / 100
-                        except ValueError:
-                            discount_pct = 0
-                    
-                    total_price = quantity * unit_price * (1 - discount_pct)
-                    
-                    return {
-                        "product_description": f"Professional {parameters.get('product', 'Software License')} designed for enterprise organizations. Includes standard features and basic support.",
-                        "unit_price": unit_price,
-                        "total_price": total_price,
-                        "terms": "Payment due within 30 days. One year warranty included.",
-                        "additional_notes": "Professional implementation support available. Regular updates included in first year."
-                    }
+        logger.warning("No quote_content model returned valid content, using fallback")
+        return fallback_quote_content(parameters)
     except Exception as e:
         logger.error(f"Error generating quote content with LLM: {e}")
         return {
@@ -237,13 +866,13 @@ async def generate_quote_content_with_llm(parameters: Dict) -> Dict:
             "additional_notes": "Professional service delivery."
         }
 
-def create_quote_pdf(parameters: Dict, quote_content: Dict, quote_id: str) -> bytes:
-    """Create a professionally styled PDF quote"""
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=72, leftMargin=72,
-                           topMargin=72, bottomMargin=18)
+@functools.lru_cache(maxsize=1)
+def get_quote_styles() -> Dict:
+    """Build the quote paragraph styles once per process"""
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
     
-    # Get styles
     styles = getSampleStyleSheet()
     title_style = ParagraphStyle(
         'CustomTitle',
@@ -269,6 +898,130 @@ def create_quote_pdf(parameters: Dict, quote_content: Dict, quote_id: str) -> by
         spaceAfter=6
     )
     
+    footer_style = ParagraphStyle(
+        'Footer',
+        parent=styles['Normal'],
+        fontSize=10,
+        alignment=TA_CENTER,
+        textColor=colors.grey
+    )
+    
+    return {
+        "title": title_style,
+        "heading": heading_style,
+        "normal": normal_style,
+        "footer": footer_style
+    }
+
+def build_quote_pricing(parameters: Dict, quote_content: Dict) -> pricing.QuotePricing:
+    """Price the quote's line items (or its single product line) in one pass"""
+    rows = parameters.get('line_items') or [{
+        'description': quote_content.get('product_description') or parameters.get('product', 'Product'),
+        'quantity': parameters.get('quantity', '1')
+    }]
+    if len(rows) > QUOTE_MAX_LINE_ITEMS:
+        raise ValueError(f"Quotes are limited to {QUOTE_MAX_LINE_ITEMS} line items (got {len(rows)})")
+    
+    # Lines without a price use the LLM's suggested unit price
+    default_unit_price = pricing.parse_number(quote_content.get('unit_price'), 100.0)
+    items = pricing.LineItems.from_rows(rows, default_unit_price, parameters.get('product', 'Item'))
+    tax_rate = pricing.parse_rate(parameters.get('tax_rate'))
+    return pricing.price_line_items(
+        items,
+        tiers=QUOTE_DISCOUNT_TIERS,
+        order_discount=pricing.parse_rate(parameters.get('discount')) or 0.0,
+        tax_rate=QUOTE_TAX_RATE if tax_rate is None else tax_rate
+    )
+
+def format_quantity(quantity: float) -> str:
+    return f"{quantity:,.0f}" if quantity.is_integer() else f"{quantity:,.2f}"
+
+@functools.lru_cache(maxsize=1)
+def get_paged_line_table_class():
+    """Flowable for long line tables, defined on first use so ReportLab stays a lazy import"""
+    from reportlab.platypus import Flowable, Table, TableStyle
+    
+    class PagedLineTable(Flowable):
+        """Single-line rows laid out a page at a time.
+        
+        Each split builds a Table of just the header plus the rows that fit in the
+        space left on the page, so the header appears once at the top of every page
+        and a 10k-line quote never lays out (or splits) one huge table. Row striping
+        continues across pages.
+        """
+        def __init__(self, header: List, make_row: Callable[[int], List], count: int, col_widths: List[float],
+                     style: TableStyle, start: int = 0, row_heights: Optional[Tuple[float, float]] = None):
+            super().__init__()
+            self.header = header
+            self.make_row = make_row
+            self.count = count
+            self.col_widths = col_widths
+            self.style = style
+            self.start = start
+            self.row_heights = row_heights or self._measure_rows()
+        
+        def _measure_rows(self) -> Tuple[float, float]:
+            sample = Table([self.header, self.make_row(0)], colWidths=self.col_widths)
+            sample.setStyle(self.style)
+            sample.wrap(sum(self.col_widths), 1e9)
+            return sample._rowHeights[0], sample._rowHeights[1]
+        
+        def _table_for(self, stop: int):
+            table = Table([self.header] + [self.make_row(i) for i in range(self.start, stop)], colWidths=self.col_widths)
+            table.setStyle(self.style)
+            if self.start % 2:
+                # Keep the stripes in step with the previous page
+                stripes = [cmd for cmd in self.style.getCommands() if cmd[0] == 'ROWBACKGROUNDS']
+                table.setStyle(TableStyle([(name, start, stop_, list(reversed(colors_)))
+                                           for name, start, stop_, colors_ in stripes]))
+            return table
+        
+        def wrap(self, availWidth, availHeight):
+            header_height, row_height = self.row_heights
+            self.width = sum(self.col_widths)
+            self.height = header_height + row_height * (self.count - self.start)
+            return self.width, self.height
+        
+        def split(self, availWidth, availHeight):
+            header_height, row_height = self.row_heights
+            fits = int((availHeight - header_height) // row_height)
+            if fits < 1:
+                return []
+            stop = min(self.start + fits, self.count)
+            page = self._table_for(stop)
+            if stop == self.count:
+                return [page]
+            rest = PagedLineTable(self.header, self.make_row, self.count, self.col_widths, self.style,
+                                  start=stop, row_heights=self.row_heights)
+            return [page, rest]
+        
+        def draw(self):
+            table = self._table_for(self.count)
+            table.wrapOn(self.canv, self.width, self.height)
+            table.drawOn(self.canv, 0, 0)
+    
+    return PagedLineTable
+
+def create_quote_pdf(parameters: Dict, quote_content: Dict, quote_pricing: pricing.QuotePricing, quote_id: str,
+                     output: Union[str, BinaryIO]):
+    """Render a professionally styled PDF quote into output (a file path or binary file object)"""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+    from xml.sax.saxutils import escape
+    
+    PagedLineTable = get_paged_line_table_class()
+    doc = SimpleDocTemplate(output, pagesize=A4, rightMargin=72, leftMargin=72,
+                           topMargin=72, bottomMargin=18)
+    
+    # Get styles
+    styles = get_quote_styles()
+    title_style = styles["title"]
+    heading_style = styles["heading"]
+    normal_style = styles["normal"]
+    footer_style = styles["footer"]
+    
     # Build the PDF content
     story = []
     
@@ -294,71 +1047,80 @@ def create_quote_pdf(parameters: Dict, quote_content: Dict, quote_id: str) -> by
     story.append(info_table)
     story.append(Spacer(1, 30))
     
-    # Product details
+    # Line items
     story.append(Paragraph("PROPOSAL DETAILS", heading_style))
     
-    # Create description as a Paragraph for proper text wrapping
-    description_text = quote_content.get('product_description', parameters.get('product', 'Product'))
-    # Limit description length for better formatting
-    if len(description_text) > 150:
-        description_text = description_text[:150] + "..."
-    
-    description_para = Paragraph(description_text, normal_style)
-    
-    product_data = [
-        ['Description', 'Qty', 'Unit Price', 'Subtotal'],
-        [
-            description_para,
-            str(parameters.get('quantity', '1')),
-            f"${quote_content.get('unit_price', 100):.2f}",
-            f"${float(parameters.get('quantity', 1)) * quote_content.get('unit_price', 100):.2f}"
-        ]
-    ]
+    items = quote_pricing.items
+    line_count = len(items)
+    wrap_descriptions = line_count <= QUOTE_WRAP_DESCRIPTION_ROWS
+    
+    def description_cell(index: int):
+        text = items.description[index]
+        if items.sku[index]:
+            text = f"{items.sku[index]} - {text}"
+        if wrap_descriptions:
+            # Limit description length for better formatting
+            return Paragraph(escape(text if len(text) <= 150 else text[:150] + "..."), normal_style)
+        return text if len(text) <= 45 else text[:45] + "..."
     
-    if parameters.get('discount') and parameters.get('discount') != 'None':
-        discount_amount = float(parameters.get('quantity', 1)) * quote_content.get('unit_price', 100) - quote_content.get('total_price', 100)
-        product_data.append([
-            Paragraph(f"Discount ({parameters.get('discount')})", normal_style),
-            '',
-            '',
-            f"-${discount_amount:.2f}"
-        ])
-    
-    # Adjusted column widths for better fit
-    product_table = Table(product_data, colWidths=[3.5*inch, 0.7*inch, 1*inch, 1.1*inch])
-    product_table.setStyle(TableStyle([
+    line_style = TableStyle([
         ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#34495e')),
         ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
         ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
         ('ALIGN', (0, 1), (0, -1), 'LEFT'),  # Description column left-aligned
+        ('ALIGN', (2, 1), (-1, -1), 'RIGHT'),  # Amounts right-aligned
         ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),  # Vertical alignment
         ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
         ('FONTSIZE', (0, 0), (-1, 0), 11),
-        ('FONTSIZE', (0, 1), (-1, -1), 10),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+        ('FONTSIZE', (0, 1), (-1, -1), 10 if wrap_descriptions else 9),
+        ('TOPPADDING', (0, 0), (-1, -1), 8 if wrap_descriptions else 3),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 8 if wrap_descriptions else 3),
         ('LEFTPADDING', (0, 0), (-1, -1), 6),
         ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#f8f9fa')),
+        ('GRID', (0, 0), (-1, -1), 1 if wrap_descriptions else 0.5, colors.black),
         ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.HexColor('#f8f9fa'), colors.white]),
-    ]))
-    story.append(product_table)
+    ])
+    header = ['Description', 'Qty', 'Unit Price', 'Discount', 'Amount']
+    col_widths = [2.55*inch, 0.65*inch, 1*inch, 0.8*inch, 1.25*inch]
+    
+    def line_row(i: int) -> List:
+        rate = quote_pricing.discount_rate[i]
+        return [
+            description_cell(i),
+            format_quantity(items.quantity[i]),
+            f"${items.unit_price[i]:,.2f}",
+            f"{rate * 100:g}%" if rate else "-",
+            f"${quote_pricing.subtotal[i] - quote_pricing.discount[i]:,.2f}"
+        ]
+    
+    if wrap_descriptions:
+        # Few rows with wrapped (variable height) descriptions: one table, header repeated by reportlab
+        line_table = Table([header] + [line_row(i) for i in range(line_count)], colWidths=col_widths, repeatRows=1)
+        line_table.setStyle(line_style)
+        story.append(line_table)
+    else:
+        story.append(PagedLineTable(header, line_row, line_count, col_widths, line_style))
     story.append(Spacer(1, 30))
     
-    # Total
-    total_data = [
-        ['TOTAL AMOUNT:', f"${quote_content.get('total_price', 100):,.2f}"]
-    ]
-    total_table = Table(total_data, colWidths=[4.6*inch, 1.4*inch])
+    # Totals
+    totals = quote_pricing.totals
+    total_data = [['Subtotal:', f"${totals['subtotal']:,.2f}"]]
+    if totals['discount']:
+        total_data.append(['Discounts:', f"-${totals['discount']:,.2f}"])
+    if totals['tax']:
+        total_data.append([f"Tax ({totals['tax_rate'] * 100:g}%):", f"${totals['tax']:,.2f}"])
+    total_data.append(['TOTAL AMOUNT:', f"${totals['total']:,.2f}"])
+    total_table = Table(total_data, colWidths=[4.6*inch, 1.65*inch])
     total_table.setStyle(TableStyle([
         ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 16),
-        ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#e3f2fd')),
-        ('BOX', (0, 0), (-1, -1), 2, colors.HexColor('#1976d2')),
-        ('TOPPADDING', (0, 0), (-1, -1), 15),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 15),
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 11),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, -1), (-1, -1), 16),
+        ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#e3f2fd')),
+        ('BOX', (0, -1), (-1, -1), 2, colors.HexColor('#1976d2')),
+        ('TOPPADDING', (0, -1), (-1, -1), 15),
+        ('BOTTOMPADDING', (0, -1), (-1, -1), 15),
     ]))
     story.append(total_table)
     story.append(Spacer(1, 30))
@@ -374,55 +1136,227 @@ def create_quote_pdf(parameters: Dict, quote_content: Dict, quote_id: str) -> by
     
     # Footer
     story.append(Spacer(1, 40))
-    footer_style = ParagraphStyle(
-        'Footer',
-        parent=styles['Normal'],
-        fontSize=10,
-        alignment=TA_CENTER,
-        textColor=colors.grey
-    )
     story.append(Paragraph("Thank you for considering our proposal. We look forward to working with you!", footer_style))
     
     # Build PDF
     doc.build(story)
-    buffer.seek(0)
-    return buffer.getvalue()
 
-async def upload_pdf_to_supabase(pdf_bytes: bytes, filename: str) -> str:
-    """Upload PDF to Supabase storage and return presigned URL"""
-    if not supabase_client:
-        # Fallback for development - save locally and serve via FastAPI
-        logger.warning("Supabase not configured, saving locally and serving via FastAPI")
-        
-        # Create temp directory if it doesn't exist
-        temp_dir = os.path.join(os.path.dirname(__file__), "temp_pdfs")
-        os.makedirs(temp_dir, exist_ok=True)
-        
-        # Save PDF locally
-        local_file_path = os.path.join(temp_dir, filename)
-        with open(local_file_path, "wb") as f:
-            f.write(pdf_bytes)
-        
-        # Return local server URL
-        return f"http://localhost:8000/download/{filename}"
-    
+def sign_download(filename: str, expires: int) -> str:
+    """HMAC token authorising a download of filename until the expires timestamp"""
+    message = f"{filename}:{expires}".encode("utf-8")
+    return hmac.new(get_download_signing_secret(), message, hashlib.sha256).hexdigest()
+
+def create_download_url(filename: str, ttl: int = DOWNLOAD_URL_TTL) -> str:
+    """Build an expiring signed /download URL for a locally stored PDF"""
+    expires = int(time.time()) + ttl
+    return f"{PUBLIC_BASE_URL}/download/{filename}?expires={expires}&token={sign_download(filename, expires)}"
+
+def local_pdf_path(filename: str) -> str:
+    """Resolve a filename inside LOCAL_PDF_DIR, rejecting anything that could escape it"""
+    if not SAFE_FILENAME_RE.match(filename):
+        raise ValueError(f"Invalid filename: {filename}")
+    return os.path.join(LOCAL_PDF_DIR, filename)
+
+def quote_spool_path(filename: str) -> str:
+    """Where a quote is rendered before it is stored.
+
+    Locally the spool file sits next to its final location so storing it is a
+    rename; with Supabase it goes to QUOTE_SPOOL_DIR and is streamed from disk.
+    """
+    directory = QUOTE_SPOOL_DIR if SUPABASE_CONFIGURED else LOCAL_PDF_DIR
+    os.makedirs(directory, exist_ok=True)
+    # Leading dot keeps spool files out of SAFE_FILENAME_RE, so /download never serves them
+    return os.path.join(directory, f".{filename}.{uuid.uuid4().hex}.part")
+
+def remove_spool_file(path: str):
     try:
-        # Upload to Supabase storage with proper content type
-        result = supabase_client.storage.from_("quotes").upload(
-            filename, 
-            pdf_bytes,
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def render_quote_to_spool(parameters: Dict, quote_content: Dict, quote_pricing: pricing.QuotePricing, quote_id: str,
+                          pdf_path: str, abandoned: threading.Event):
+    """Render a quote PDF to its spool file in a worker thread, cleaning up after itself.
+
+    A timed-out or cancelled tool stops waiting but cannot stop this thread, which
+    would still write the file at canvas.save(); the caller sets abandoned and the
+    file is removed here once rendering ends, so no spool file outlives its tool call.
+    """
+    try:
+        create_quote_pdf(parameters, quote_content, quote_pricing, quote_id, pdf_path)
+    except BaseException:
+        remove_spool_file(pdf_path)
+        raise
+    if abandoned.is_set():
+        remove_spool_file(pdf_path)
+
+def sweep_local_pdfs() -> Tuple[int, int]:
+    """Delete local PDFs past LOCAL_PDF_TTL, then oldest-first until under LOCAL_PDF_MAX_BYTES"""
+    try:
+        entries = [entry for entry in os.scandir(LOCAL_PDF_DIR) if entry.is_file()]
+    except FileNotFoundError:
+        return 0, 0
+    
+    now = time.time()
+    files = []
+    removed = 0
+    freed = 0
+    for entry in entries:
+        stat = entry.stat()
+        # Leftover .part files older than the TTL are from interrupted writes
+        if now - stat.st_mtime > LOCAL_PDF_TTL:
+            try:
+                os.remove(entry.path)
+                removed += 1
+                freed += stat.st_size
+            except FileNotFoundError:
+                pass
+        else:
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+    
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= LOCAL_PDF_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            removed += 1
+            freed += size
+        except FileNotFoundError:
+            pass
+        total -= size
+    
+    return removed, freed
+
+async def local_pdf_sweep_loop():
+    """Periodically enforce the TTL and total-size budget on LOCAL_PDF_DIR"""
+    while True:
+        try:
+            removed, freed = await asyncio.to_thread(sweep_local_pdfs)
+            if removed:
+                logger.info(f"Swept {removed} local PDFs ({freed} bytes)")
+        except Exception as e:
+            logger.error(f"Error sweeping local PDFs: {e}")
+        await asyncio.sleep(LOCAL_PDF_SWEEP_INTERVAL)
+
+def upload_file_to_bucket(supabase_client, pdf_path: str, filename: str):
+    """Blocking upload that streams the file from disk in chunks (multipart body built by httpx)"""
+    with open(pdf_path, "rb") as f:
+        return supabase_client.storage.from_("quotes").upload(
+            filename,
+            f,
             file_options={
                 "content-type": "application/pdf",
                 "cache-control": "3600"
             }
         )
+
+async def sign_object_paths(paths: List[str], touch: bool = True) -> Dict[str, Tuple[str, float]]:
+    """Sign many quote objects with one storage request per SIGNED_URL_BATCH_SIZE paths; path -> (url, expires_at)"""
+    signed = {}
+    bucket = get_supabase_client().storage.from_("quotes")
+    for start in range(0, len(paths), SIGNED_URL_BATCH_SIZE):
+        batch = paths[start:start + SIGNED_URL_BATCH_SIZE]
+        expires_at = time.time() + SIGNED_URL_TTL
+        signed_url_cache.signing_requests += 1
+        results = await asyncio.to_thread(bucket.create_signed_urls, batch, SIGNED_URL_TTL)
+        for item in results:
+            if item.get('error') or not item.get('signedURL'):
+                logger.warning(f"Could not sign {item.get('path')}: {item.get('error')}")
+                continue
+            signed[item['path']] = (item['signedURL'], expires_at)
+            signed_url_cache.put(item['path'], item['signedURL'], expires_at, touch=touch)
+    return signed
+
+async def get_signed_urls(paths: List[str]) -> Dict[str, Tuple[str, float]]:
+    """(url, expires_at) per object path, reusing still-valid cached URLs and bulk-signing the rest"""
+    if not SUPABASE_CONFIGURED:
+        # Local download links are signed in-process, there is nothing to save by caching them
+        expires_at = time.time() + SIGNED_URL_TTL
+        return {path: (create_download_url(path, SIGNED_URL_TTL), expires_at) for path in paths}
+    
+    urls = {}
+    misses = []
+    for path in paths:
+        cached = signed_url_cache.get(path)
+        if cached:
+            urls[path] = cached
+        else:
+            misses.append(path)
+    if misses:
+        urls.update(await sign_object_paths(misses))
+    return urls
+
+def url_expires_in(expires_at: Optional[float]) -> int:
+    """Whole seconds a signed URL remains valid (SIGNED_URL_TTL when there is none)"""
+    if expires_at is None:
+        return SIGNED_URL_TTL
+    return max(int(expires_at - time.time()), 0)
+
+async def signed_url_refresh_loop(interval: float = 60.0):
+    """Re-sign recently used URLs before they expire so re-shares never wait on storage"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            paths = signed_url_cache.due_for_refresh(horizon=interval)
+            if paths:
+                refreshed = await sign_object_paths(paths, touch=False)
+                signed_url_cache.refreshed += len(refreshed)
+        except Exception as e:
+            logger.error(f"Error refreshing signed URLs: {e}")
+
+def find_quote_object(quote_id: str) -> Optional[str]:
+    """Look up an unindexed (pre-index) quote's object path in storage by its quote_id prefix (blocking)"""
+    prefix = f"{quote_id}_quote_"
+    supabase_client = get_supabase_client()
+    if not supabase_client:
+        try:
+            names = os.listdir(LOCAL_PDF_DIR)
+        except FileNotFoundError:
+            return None
+        return next((name for name in names if name.startswith(prefix) and SAFE_FILENAME_RE.match(name)), None)
+    
+    objects = supabase_client.storage.from_("quotes").list("", {"search": prefix, "limit": 1})
+    return objects[0]['name'] if objects else None
+
+async def resolve_quote_object_paths(quote_ids: List[str], client_id: str) -> Dict[str, str]:
+    """Map the client's quote ids to storage object paths (quote index first, storage listing for older quotes)
+
+    Indexed quotes owned by another client are left out. Quotes from before the
+    index have no recorded owner and are found by their (unguessable) id alone.
+    """
+    owned = await asyncio.to_thread(quote_index.object_paths, quote_ids)
+    paths = {quote_id: path for quote_id, (path, owner) in owned.items() if owner == client_id}
+    unknown = [quote_id for quote_id in quote_ids if quote_id not in owned]
+    found = await asyncio.gather(*[asyncio.to_thread(find_quote_object, quote_id) for quote_id in unknown])
+    for quote_id, path in zip(unknown, found):
+        if path:
+            paths[quote_id] = path
+    return paths
+
+async def upload_pdf_to_supabase(pdf_path: str, filename: str) -> str:
+    """Store a rendered PDF spool file (consuming it) and return presigned URL"""
+    supabase_client = get_supabase_client()
+    if not supabase_client:
+        # Fallback for development - save locally and serve via the /download route
+        logger.warning("Supabase not configured, saving locally and serving via FastAPI")
+        
+        # The spool file is already in LOCAL_PDF_DIR: an atomic rename publishes it without copying
+        await asyncio.to_thread(os.replace, pdf_path, local_pdf_path(filename))
+        
+        # Return an expiring signed local URL
+        return create_download_url(filename)
+    
+    try:
+        # Upload to Supabase storage off the event loop, reading the PDF from disk in chunks
+        result = await asyncio.to_thread(upload_file_to_bucket, supabase_client, pdf_path, filename)
         
         if result:
-            # Create a presigned URL that expires in 1 hour
-            signed_url_result = supabase_client.storage.from_("quotes").create_signed_url(filename, 3600)
+            # Create a presigned URL that expires in 1 hour (cached for re-sharing)
+            signed = (await get_signed_urls([filename])).get(filename)
             
-            if signed_url_result and 'signedURL' in signed_url_result:
-                return signed_url_result['signedURL']
+            if signed:
+                return signed[0]
             else:
                 logger.error("Failed to create signed URL")
                 return f"https://supabase-fallback.com/quotes/{filename}"
@@ -433,47 +1367,61 @@ async def upload_pdf_to_supabase(pdf_bytes: bytes, filename: str) -> str:
     except Exception as e:
         logger.error(f"Error uploading to Supabase: {e}")
         return f"https://supabase-fallback.com/quotes/{filename}"
+    finally:
+        await asyncio.to_thread(remove_spool_file, pdf_path)
 
 async def execute_tool(tool_call: Dict, client_id: str) -> Dict:
-    """Execute a tool call and return the result"""
-    tool_name = tool_call['tool_name']
-    parameters = tool_call['parameters']
-    
-    if tool_name == 'generate_quote':
-        return await execute_generate_quote(parameters, client_id)
-    elif tool_name == 'create_approval_flow':
-        return await execute_create_approval_flow(parameters, client_id)
-    else:
-        logger.error(f"Unknown tool: {tool_name}")
-        return {
-            'success': False,
-            'error': f"Unknown tool: {tool_name}"
-        }
+    """Execute a tool call through the tool registry and return the result"""
+    return await tool_registry.execute(tool_call, client_id)
 
 async def execute_generate_quote(parameters: Dict, client_id: str) -> Dict:
     """Execute the generate_quote tool with real PDF generation"""
-    logger.info(f"Executing generate_quote for client {client_id}")
-    logger.info(f"Parameters: {parameters}")
-    
     try:
         # Generate quote ID
         quote_id = str(uuid.uuid4())
+        log_event(logger, "quote.start", client_id=client_id, quote_id=quote_id, parameters=parameters)
         
         # Step 1: Generate quote content using LLM
-        logger.info("Generating quote content with LLM...")
         quote_content = await generate_quote_content_with_llm(parameters)
-        logger.info(f"Generated quote content: {quote_content}")
+        log_event(logger, "quote.content", logging.DEBUG, quote_id=quote_id, content=dict(quote_content))  # copy: total_price is set below
         
-        # Step 2: Create PDF
-        logger.info("Creating PDF document...")
-        pdf_bytes = create_quote_pdf(parameters, quote_content, quote_id)
-        logger.info(f"Created PDF with {len(pdf_bytes)} bytes")
+        # Price every line in one pass; the computed total replaces the LLM's estimate
+        quote_pricing = await tool_registry.run_blocking(build_quote_pricing, parameters, quote_content)
+        quote_content['total_price'] = quote_pricing.totals['total']
+        
+        safe_customer = re.sub(r'[^A-Za-z0-9_-]+', '_', parameters.get('customer_name', 'customer')).strip('_') or 'customer'
+        filename = f"{quote_id}_quote_{safe_customer}.pdf"
+        
+        # Step 2: Render the PDF straight to a spool file on disk (off the event loop)
+        pdf_path = quote_spool_path(filename)
+        abandoned = threading.Event()
+        try:
+            await tool_registry.run_blocking(render_quote_to_spool, parameters, quote_content, quote_pricing, quote_id,
+                                             pdf_path, abandoned)
+        except BaseException:
+            # The render thread removes the file itself if it is still running; this covers one that just finished
+            abandoned.set()
+            await asyncio.to_thread(remove_spool_file, pdf_path)
+            raise
+        pdf_bytes = os.path.getsize(pdf_path)
         
         # Step 3: Upload to Supabase and get presigned URL
-        filename = f"{quote_id}_quote_{parameters.get('customer_name', 'customer').replace(' ', '_')}.pdf"
-        logger.info(f"Uploading to Supabase as {filename}...")
-        presigned_url = await upload_pdf_to_supabase(pdf_bytes, filename)
-        logger.info(f"Upload complete, presigned URL: {presigned_url}")
+        presigned_url = await upload_pdf_to_supabase(pdf_path, filename)
+        await asyncio.to_thread(
+            quote_index.add,
+            quote_id,
+            customer=parameters.get('customer_name', 'Unknown'),
+            product=parameters.get('product') or (quote_pricing.items.description[0] if len(quote_pricing.items) == 1 else None),
+            quantity=sum(quote_pricing.items.quantity),
+            discount=parameters.get('discount'),
+            total=quote_pricing.totals['total'],
+            object_path=filename,
+            line_count=quote_pricing.totals['line_count'],
+            quote_name=parameters.get('quote_name'),
+            client_id=client_id
+        )
+        log_event(logger, "quote.stored", quote_id=quote_id, filename=filename, bytes=pdf_bytes,
+                  total_price=quote_content.get('total_price'))
         
         # Return completion result
         return {
@@ -484,7 +1432,8 @@ async def execute_generate_quote(parameters: Dict, client_id: str) -> Dict:
             'customer_name': parameters.get('customer_name', 'Unknown'),
             'quote_name': parameters.get('quote_name', 'Quote Document'),
             'filename': filename,
-            'total_amount': quote_content.get('total_price', 0)
+            'total_amount': quote_content.get('total_price', 0),
+            'line_count': quote_pricing.totals['line_count']
         }
         
     except Exception as e:
@@ -496,25 +1445,50 @@ async def execute_generate_quote(parameters: Dict, client_id: str) -> Dict:
         }
 
 async def execute_create_approval_flow(parameters: Dict, client_id: str) -> Dict:
-    """Execute the create_approval_flow tool"""
-    logger.info(f"Executing create_approval_flow for client {client_id}")
-    
-    # Simulate processing time
-    await asyncio.sleep(1.5)
+    """Execute the create_approval_flow tool: build the step graph and persist the workflow"""
+    log_event(logger, "approval_flow.start", client_id=client_id, parameters=parameters)
     
-    # Generate a mock workflow ID and file
-    workflow_id = str(uuid.uuid4())
-    file_path = f"/workflows/{workflow_id}/approval_flow.json"
+    workflow = await tool_registry.run_blocking(
+        workflow_store.create,
+        parameters.get('flow_name', 'Approval Workflow'),
+        parameters.get('description'),
+        parameters.get('approvers'),
+        parameters.get('steps'),
+        client_id
+    )
     
     # Return completion result
     return {
         'success': True,
         'tool_name': 'create_approval_flow',
-        'file_path': file_path,
-        'workflow_id': workflow_id,
-        'flow_name': parameters.get('flow_name', 'Approval Workflow')
+        'file_path': f"{PUBLIC_BASE_URL}/workflows/{workflow['workflow_id']}",
+        'workflow_id': workflow['workflow_id'],
+        'flow_name': workflow['flow_name'],
+        'steps': [{'stage': step['stage'], 'name': step['name'], 'approver': step['approver']} for step in workflow['steps']],
+        'stage_count': workflow['stage_count']
     }
 
+tool_registry.register(ToolSpec(
+    name="generate_quote",
+    handler=execute_generate_quote,
+    parameters=GenerateQuoteParams,
+    kind=TOOL_KIND_CPU,
+    timeout=QUOTE_TOOL_TIMEOUT,
+    max_concurrency=QUOTE_TOOL_MAX_CONCURRENCY,
+    status="Generating Quote",
+    status_message="Creating your quote document..."
+))
+tool_registry.register(ToolSpec(
+    name="create_approval_flow",
+    handler=execute_create_approval_flow,
+    parameters=ApprovalFlowParams,
+    kind=TOOL_KIND_IO,
+    timeout=APPROVAL_TOOL_TIMEOUT,
+    max_concurrency=APPROVAL_TOOL_MAX_CONCURRENCY,
+    status="Creating Approval Flow",
+    status_message="Setting up your approval workflow..."
+))
+
 def remove_tool_calls_from_content(content: str) -> str:
     """Remove XML tool calls from content to keep only user-visible text"""
     # Remove all tool_call XML blocks
@@ -571,99 +1545,368 @@ def get_safe_content_to_stream(content_buffer: str, streamed_length: int) -> str
     # No tool call issues - stream the new content
     return new_content
 
-async def execute_and_notify_tool(tool_call: Dict, client_id: str):
-    """Execute a tool and send completion notification"""
-    try:
-        # Send tool XML to client for backend processing
-        tool_xml_msg = {
-            "type": "tool_call",
-            "message_id": tool_call.get('message_id'),
-            "tool_name": tool_call['tool_name'],
-            "parameters": tool_call['parameters']
+def build_tool_result_message(tool_name: str, message_id: Optional[str], result: Dict) -> Dict:
+    """Build the tool_complete / tool_error frame for a tool result"""
+    if result.get('success'):
+        return {
+            "type": "tool_complete",
+            "message_id": message_id,
+            "tool_name": result.get('tool_name', tool_name),
+            "file_path": result.get('file_path'),
+            "data": {k: v for k, v in result.items() if k not in ['success', 'tool_name', 'file_path']}
         }
-        await manager.send_personal_message(json.dumps(tool_xml_msg), client_id)
-        
-        # Note: initial status is sent during streaming; this function is retained for compatibility.
+    return {
+        "type": "tool_error",
+        "message_id": message_id,
+        "tool_name": tool_name,
+        "error": result.get('error', 'Unknown error')
+    }
+
+async def submit_tool_job(tool_call: Dict, client_id: str) -> str:
+    """Persist a tool call in the durable job queue and return the job id"""
+    job_id = await asyncio.to_thread(
+        tool_queue.submit,
+        tool_call['tool_name'],
+        tool_call['parameters'],
+        client_id,
+        tool_call.get('message_id')
+    )
+    if inline_tool_worker:
+        inline_tool_worker.notify()
+    return job_id
+
+async def deliver_finished_jobs():
+    """Push results of finished jobs to their owning clients if they are connected to this process"""
+    connected_clients = list(manager.active_connections)
+    if not connected_clients:
+        return
+    
+    jobs = await asyncio.to_thread(tool_queue.pending_notifications, connected_clients)
+    for job in jobs:
+        client_id = job['client_id']
+        if client_id not in manager.active_connections:
+            continue
         
-        # Execute the tool
-        result = await execute_tool(tool_call, client_id)
+        result = job['result'] or {'success': False, 'error': job['error'] or 'Unknown error'}
+        message = build_tool_result_message(job['tool_name'], job['message_id'], result)
+        message["job_id"] = job['job_id']
+        # Claim before sending so a client connected to two processes gets the result once
+        if not await asyncio.to_thread(tool_queue.claim_notification, job['job_id']):
+            continue
+        try:
+            if client_id not in manager.active_connections:
+                raise ConnectionError("client disconnected")
+            await manager.send_message(message, client_id)
+        except Exception as e:
+            logger.warning(f"Could not deliver job {job['job_id']} to client {client_id}: {e}")
+            await asyncio.to_thread(tool_queue.release_notification, job['job_id'])
+            continue
         
-        if result['success']:
-            # Send completion message
-            completion_msg = {
-                "type": "tool_complete",
-                "message_id": tool_call.get('message_id'),
-                "tool_name": result['tool_name'],
-                "file_path": result['file_path'],
-                "data": {k: v for k, v in result.items() if k not in ['success', 'tool_name', 'file_path']}
-            }
-            await manager.send_personal_message(json.dumps(completion_msg), client_id)
-            logger.info(f"Tool {tool_call['tool_name']} completed successfully for client {client_id}")
+        if message["type"] == "tool_complete":
+            log_event(logger, "tool.delivered", client_id=client_id, tool_name=job['tool_name'], job_id=job['job_id'])
         else:
-            # Send error message
-            error_msg = {
-                "type": "tool_error",
-                "message_id": tool_call.get('message_id'),
-                "tool_name": tool_call['tool_name'],
-                "error": result.get('error', 'Unknown error')
-            }
-            await manager.send_personal_message(json.dumps(error_msg), client_id)
-            logger.error(f"Tool {tool_call['tool_name']} failed for client {client_id}: {result.get('error')}")
-            
-    except Exception as e:
-        logger.error(f"Error executing tool {tool_call['tool_name']} for client {client_id}: {str(e)}")
-        error_msg = {
-            "type": "tool_error",
-            "tool_name": tool_call['tool_name'],
-            "error": str(e)
-        }
-        await manager.send_personal_message(json.dumps(error_msg), client_id)
+            logger.error(f"Tool {job['tool_name']} failed for client {client_id}: {message['error']}")
+
+async def job_dispatch_loop():
+    """Poll the job queue for finished jobs and push them to clients"""
+    last_purge = 0.0
+    while True:
+        try:
+            await asyncio.wait_for(job_dispatch_wakeup.wait(), timeout=TOOL_QUEUE_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        job_dispatch_wakeup.clear()
+        
+        try:
+            await deliver_finished_jobs()
+            if time.monotonic() - last_purge > 3600:
+                last_purge = time.monotonic()
+                purged = await asyncio.to_thread(tool_queue.purge_finished, TOOL_JOB_RETENTION_SECONDS)
+                if purged:
+                    logger.info(f"Purged {purged} finished tool jobs")
+        except Exception as e:
+            logger.error(f"Error dispatching tool job results: {e}")
+
+def track_tool_task(coro) -> asyncio.Task:
+    """Run tool work in the background, keeping a reference until it finishes (drained on shutdown)"""
+    task = asyncio.create_task(coro)
+    pending_tool_tasks.add(task)
+    task.add_done_callback(pending_tool_tasks.discard)
+    return task
+
+async def connection_heartbeat_loop():
+    """Heartbeat quiet sockets, drop ones whose sends fail and close idle ones"""
+    while True:
+        await asyncio.sleep(WS_HEARTBEAT_INTERVAL)
+        now = time.monotonic()
+        heartbeats = []
+        for state in list(manager.active_connections.values()):
+            if WS_IDLE_TIMEOUT and not state.tasks and now - state.last_seen > WS_IDLE_TIMEOUT:
+                manager.reaped += 1
+                logger.info(f"Closing idle connection {state.client_id} (no messages for {now - state.last_seen:.0f}s)")
+                await manager.close(state, WS_CLOSE_IDLE, "Idle timeout")
+            elif now - state.last_sent >= WS_HEARTBEAT_INTERVAL:
+                heartbeats.append(state)
+        
+        # Concurrently, so one stalled socket cannot hold up the rest
+        results = await asyncio.gather(*[manager.heartbeat(state) for state in heartbeats])
+        for state, alive in zip(heartbeats, results):
+            if not alive:
+                manager.heartbeat_failures += 1
+                logger.info(f"Heartbeat to {state.client_id} failed, dropping the connection")
+                await manager.close(state, 1011, "Heartbeat failed")
+
+async def drain_connections():
+    """Tell connected clients the server is going away and wait for outstanding tool work"""
+    manager.draining = True
+    if inline_tool_worker:
+        # Otherwise jobs claimed after the snapshot below would be cut off mid-run
+        inline_tool_worker.stop_claiming()
+    logger.info(f"Draining {len(manager.active_connections)} connections (deadline {SHUTDOWN_DRAIN_TIMEOUT:.0f}s)")
+    
+    notice = {
+        "type": "server_shutdown",
+        "message": "The server is restarting. Please reconnect in a few seconds."
+    }
+    for client_id in list(manager.active_connections):
+        try:
+            await manager.send_message(notice, client_id)
+        except Exception as e:
+            logger.debug(f"Could not send shutdown notice to {client_id}: {e}")
+    
+    deadline = time.monotonic() + SHUTDOWN_DRAIN_TIMEOUT
+    while True:
+        # Re-snapshot: a claim already in flight when claiming stopped may still start a task
+        outstanding = {task for task in pending_tool_tasks if not task.done()}
+        if inline_tool_worker:
+            outstanding |= {task for task in inline_tool_worker.running_tasks if not task.done()}
+        remaining = deadline - time.monotonic()
+        if not outstanding:
+            break
+        if remaining <= 0:
+            logger.warning(f"{len(outstanding)} tool tasks still running at drain deadline; their jobs will be re-claimed after the lease expires")
+            break
+        await asyncio.wait(outstanding, timeout=remaining)
+    
+    # Push whatever finished while draining before sockets are closed
+    await deliver_finished_jobs()
+
+def install_drain_signal_handlers():
+    """Run drain_connections() before handing SIGTERM/SIGINT back to the server's own handler"""
+    if threading.current_thread() is not threading.main_thread():
+        return
+    
+    loop = asyncio.get_running_loop()
+    
+    async def drain_then_exit(previous, signum):
+        try:
+            await drain_connections()
+        finally:
+            previous(signum, None)
+    
+    def start_drain(previous, signum):
+        task = loop.create_task(drain_then_exit(previous, signum))
+        drain_tasks.add(task)
+        task.add_done_callback(drain_tasks.discard)
+    
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        previous = signal.getsignal(sig)
+        if not callable(previous):
+            continue
+        
+        def handler(signum, frame, previous=previous):
+            if manager.draining:
+                # Second signal: skip the drain and shut down right away
+                previous(signum, frame)
+                return
+            manager.draining = True
+            loop.call_soon_threadsafe(start_drain, previous, signum)
+        
+        signal.signal(sig, handler)
 
 async def execute_tool_only(tool_call: Dict, client_id: str):
-    """Execute a tool without sending initial status (status already sent during streaming)"""
+    """Queue a tool job (status already sent during streaming); the dispatcher pushes the result"""
     try:
+        if tool_registry.get(tool_call['tool_name']) is None:
+            raise ValueError(f"Unknown tool: {tool_call['tool_name']}")
+        job_id = await submit_tool_job(tool_call, client_id)
+        
         # Send tool XML to client for backend processing
         tool_xml_msg = {
             "type": "tool_call",
             "message_id": tool_call.get('message_id'),
             "tool_name": tool_call['tool_name'],
-            "parameters": tool_call['parameters']
+            "parameters": tool_call['parameters'],
+            "job_id": job_id
         }
-        await manager.send_personal_message(json.dumps(tool_xml_msg), client_id)
-        
-        # Execute the tool (status already sent during streaming)
-        result = await execute_tool(tool_call, client_id)
+        await manager.send_message(tool_xml_msg, client_id)
         
-        if result['success']:
-            # Send completion message
-            completion_msg = {
-                "type": "tool_complete",
-                "message_id": tool_call.get('message_id'),
-                "tool_name": result['tool_name'],
-                "file_path": result['file_path'],
-                "data": {k: v for k, v in result.items() if k not in ['success', 'tool_name', 'file_path']}
-            }
-            await manager.send_personal_message(json.dumps(completion_msg), client_id)
-            logger.info(f"Tool {tool_call['tool_name']} completed successfully for client {client_id}")
-        else:
-            # Send error message
-            error_msg = {
-                "type": "tool_error",
-                "message_id": tool_call.get('message_id'),
-                "tool_name": tool_call['tool_name'],
-                "error": result.get('error', 'Unknown error')
-            }
-            await manager.send_personal_message(json.dumps(error_msg), client_id)
-            logger.error(f"Tool {tool_call['tool_name']} failed for client {client_id}: {result.get('error')}")
-            
     except Exception as e:
-        logger.error(f"Error executing tool {tool_call['tool_name']} for client {client_id}: {str(e)}")
+        logger.error(f"Error queueing tool {tool_call['tool_name']} for client {client_id}: {str(e)}")
         error_msg = {
             "type": "tool_error",
+            "message_id": tool_call.get('message_id'),
             "tool_name": tool_call['tool_name'],
             "error": str(e)
         }
-        await manager.send_personal_message(json.dumps(error_msg), client_id)
+        await manager.send_message(error_msg, client_id)
+
+async def start_tool_calls(content_buffer: str, tool_calls_processed: set, message_id: str, client_id: str) -> int:
+    """Send status and queue every complete tool call in the buffer not seen before; returns how many started"""
+    started = 0
+    for tool_call in extract_tool_calls(content_buffer):
+        # Create a stable signature based on tool content
+        tool_signature = f"{tool_call['tool_name']}_{hash(json.dumps(tool_call['parameters'], sort_keys=True))}"
+        if tool_signature in tool_calls_processed:
+            continue
+        tool_calls_processed.add(tool_signature)
+        started += 1
+        log_event(logger, "tool.detected", client_id=client_id, tool_name=tool_call['tool_name'], message_id=message_id)
+        
+        # Send status immediately when tool is detected, then queue it in the background
+        await manager.send_message(tool_registry.status_frame(tool_call['tool_name'], message_id), client_id)
+        track_tool_task(execute_tool_only({**tool_call, "message_id": message_id}, client_id))
+    return started
+
+async def _open_stream_attempt(client: httpx.AsyncClient, payload: Dict, headers: Dict) -> Tuple[httpx.Response, AsyncIterator[str], str]:
+    """Send one streaming request and wait until its first SSE data line arrives"""
+    request = client.build_request("POST", OPENAI_API_URL, json=payload, headers=headers)
+    response = await client.send(request, stream=True)
+    try:
+        if response.status_code != 200:
+            raise UpstreamStatusError(response.status_code, await response.aread())
+
+        lines = response.aiter_lines()
+        async for line in lines:
+            if line.startswith("data: "):
+                return response, lines, line
+        raise httpx.RemoteProtocolError("Stream ended before the first token", request=request)
+    except BaseException:
+        await response.aclose()
+        raise
+
+async def _race_stream_attempts(client: httpx.AsyncClient, payload: Dict, headers: Dict) -> Tuple[httpx.Response, AsyncIterator[str], str, bool]:
+    """Run one attempt (plus an optional hedge) and keep whichever reaches the first token first"""
+    started = time.perf_counter()
+    deadline = started + OPENAI_FIRST_TOKEN_TIMEOUT
+    hedge_at = started + upstream_stats.hedge_delay() if OPENAI_HEDGE_ENABLED else None
+
+    primary = asyncio.create_task(_open_stream_attempt(client, payload, headers))
+    pending = {primary}
+    errors = []
+    try:
+        while pending:
+            now = time.perf_counter()
+            if now >= deadline:
+                raise asyncio.TimeoutError()
+
+            wake_at = deadline
+            if hedge_at is not None:
+                if now >= hedge_at:
+                    # Primary is an outlier: start a duplicate and race them
+                    hedge_at = None
+                    upstream_stats.hedges += 1
+                    pending.add(asyncio.create_task(_open_stream_attempt(client, payload, headers)))
+                else:
+                    wake_at = min(wake_at, hedge_at)
+
+            done, pending = await asyncio.wait(pending, timeout=wake_at - now, return_when=asyncio.FIRST_COMPLETED)
+
+            winner = None
+            for task in done:
+                if task.exception() is not None:
+                    errors.append(task.exception())
+                elif winner is None:
+                    winner = task
+                else:
+                    # Both streams started in the same tick - drop the extra one
+                    await task.result()[0].aclose()
+
+            if winner is not None:
+                upstream_stats.record_first_token(time.perf_counter() - started)
+                hedged = winner is not primary
+                if hedged:
+                    upstream_stats.hedge_wins += 1
+                response, lines, first_line = winner.result()
+                return response, lines, first_line, hedged
+
+        raise errors[-1]
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+async def open_openai_stream(client: httpx.AsyncClient, payload: Dict, headers: Dict) -> Tuple[httpx.Response, AsyncIterator[str], Dict]:
+    """Open a streaming completion, retrying failures that happen before the first token"""
+    last_error: Optional[BaseException] = None
+    retries = 0
+    hedged = False
+
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        if attempt:
+            retries += 1
+            upstream_stats.retries += 1
+            await asyncio.sleep(OPENAI_RETRY_BACKOFF * (2 ** (attempt - 1)))
+
+        try:
+            response, lines, first_line, hedged = await _race_stream_attempts(client, payload, headers)
+        except UpstreamStatusError as e:
+            if e.status_code not in OPENAI_RETRYABLE_STATUS_CODES:
+                upstream_stats.failures += 1
+                raise
+            last_error = e
+        except (httpx.TransportError, asyncio.TimeoutError) as e:
+            last_error = e
+        else:
+            async def chained_lines() -> AsyncIterator[str]:
+                yield first_line
+                async for line in lines:
+                    yield line
+
+            return response, chained_lines(), {"retries": retries, "hedged": hedged}
+
+        logger.warning(f"OpenAI stream attempt {attempt + 1} failed before first token: {last_error!r}")
+
+    upstream_stats.failures += 1
+    raise last_error
+
+async def open_routed_stream(client: httpx.AsyncClient, payload: Dict, headers: Dict, client_id: str) -> Tuple[httpx.Response, AsyncIterator[str], Dict]:
+    """Open the chat stream on the first chat model tier that reaches its first token"""
+    models = model_router.candidates("chat")
+    for attempt, model in enumerate(models):
+        payload["model"] = model
+        started = time.perf_counter()
+        try:
+            opened = await open_openai_stream(client, payload, headers)
+        except (UpstreamStatusError, httpx.TransportError, asyncio.TimeoutError) as e:
+            model_router.record(model, time.perf_counter() - started, ok=False)
+            if attempt == len(models) - 1:
+                raise
+            model_router.fallbacks += 1
+            log_event(logger, "model.failed", logging.WARNING, call_site="chat", model=model,
+                      client_id=client_id, error=repr(e), fallback=models[attempt + 1])
+            continue
+        model_router.record(model, time.perf_counter() - started, ok=True)
+        return opened
+
+async def replay_cached_response(content: str, client_id: str):
+    """Replay a cached answer with the same frames (and similar pacing) as a live stream"""
+    message_id = str(uuid.uuid4())
+    await manager.send_message({"type": "response_start", "message_id": message_id}, client_id)
+    
+    envelope = codec.ChunkEnvelope(message_id)
+    for start in range(0, len(content), RESPONSE_CACHE_REPLAY_CHUNK_SIZE):
+        await manager.send_chunk(envelope, content[start:start + RESPONSE_CACHE_REPLAY_CHUNK_SIZE], client_id)
+        if RESPONSE_CACHE_REPLAY_DELAY:
+            await asyncio.sleep(RESPONSE_CACHE_REPLAY_DELAY)
+    
+    final_msg = {
+        "type": "response_complete",
+        "message_id": message_id,
+        "content": content
+    }
+    await manager.send_message(final_msg, client_id)
 
 async def stream_openai_response(messages: List[Dict[str, str]], client_id: str):
     """Stream OpenAI chat completion response back to the client"""
@@ -673,7 +1916,7 @@ async def stream_openai_response(messages: List[Dict[str, str]], client_id: str)
             "type": "error",
             "message": "OpenAI API key not configured"
         }
-        await manager.send_personal_message(json.dumps(error_msg), client_id)
+        await manager.send_message(error_msg, client_id)
         return
     
     # Load system prompt and prepend to messages
@@ -686,175 +1929,202 @@ async def stream_openai_response(messages: List[Dict[str, str]], client_id: str)
     }
     
     payload = {
-        "model": "gpt-4o",
         "messages": full_messages,
         "stream": True,
         "temperature": 0.7,
-        "max_tokens": 1000
+        "max_tokens": CHAT_MAX_TOKENS
     }
     
+    cache_key = None
+    if RESPONSE_CACHE_ENABLED:
+        # Keyed on the primary tier so a fallback answer stays cacheable under the same key
+        cache_key = ResponseCache.make_key(system_prompt, model_router.primary("chat"), messages)
+        cached_content = response_cache.get(cache_key)
+        if cached_content is not None:
+            log_event(logger, "cache.hit", client_id=client_id)
+            await replay_cached_response(cached_content, client_id)
+            return
+    
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            async with client.stream("POST", OPENAI_API_URL, json=payload, headers=headers) as response:
-                if response.status_code != 200:
-                    error_text = await response.aread()
-                    logger.error(f"OpenAI API error: {response.status_code} - {error_text}")
-                    error_msg = {
-                        "type": "error",
-                        "message": f"OpenAI API error: {response.status_code}"
-                    }
-                    await manager.send_personal_message(json.dumps(error_msg), client_id)
-                    return
-                
-                # Send start of response
-                start_msg = {
-                    "type": "response_start",
-                    "message_id": str(uuid.uuid4())
-                }
-                await manager.send_personal_message(json.dumps(start_msg), client_id)
-                
-                current_message_id = start_msg["message_id"]
-                
-                content_buffer = ""
-                streamed_length = 0  # Track how much content we've already streamed
-                tool_calls_processed = set()  # Track processed tool calls to avoid duplicates
-                
-                async for line in response.aiter_lines():
-                    if line.startswith("data: "):
-                        data = line[6:]  # Remove "data: " prefix
+        client = get_http_client()
+        response, lines, attempt_info = await open_routed_stream(client, payload, headers, client_id)
+        if attempt_info["retries"] or attempt_info["hedged"]:
+            log_event(logger, "upstream.recovered", client_id=client_id, retries=attempt_info['retries'], hedged=attempt_info['hedged'])
+        
+        try:
+            # Send start of response
+            start_msg = {
+                "type": "response_start",
+                "message_id": str(uuid.uuid4())
+            }
+            await manager.send_message(start_msg, client_id)
+            
+            current_message_id = start_msg["message_id"]
+            chunk_envelope = codec.ChunkEnvelope(current_message_id)
+            
+            content_buffer = ""
+            streamed_length = 0  # Track how much content we've already streamed
+            tool_calls_processed = set()  # Track processed tool calls to avoid duplicates
+            
+            async for line in lines:
+                if line.startswith("data: "):
+                    data = line[6:]  # Remove "data: " prefix
+                    
+                    if data == "[DONE]":
+                        # Process any remaining tool calls before finalizing
+                        if await start_tool_calls(content_buffer, tool_calls_processed, current_message_id, client_id) == 0:
+                            logger.debug("No new tool calls found in final buffer")
                         
-                        if data == "[DONE]":
-                            # Process any remaining tool calls before finalizing
-                            tool_calls = extract_tool_calls(content_buffer)
-                            new_tool_calls = 0
-                            for tool_call in tool_calls:
-                                # Create a stable signature based on tool content
-                                tool_signature = f"{tool_call['tool_name']}_{hash(json.dumps(tool_call['parameters'], sort_keys=True))}"
-                                if tool_signature not in tool_calls_processed:
-                                    tool_calls_processed.add(tool_signature)
-                                    new_tool_calls += 1
-                                    logger.info(f"Final buffer: executing {tool_call['tool_name']}")
-                                    
-                                    # Send status immediately for final buffer tools too
-                                    status_msg = {
-                                        "type": "tool_status",
-                                        "message_id": current_message_id,
-                                        "tool_name": tool_call['tool_name'],
-                                        "status": "Generating Quote" if tool_call['tool_name'] == 'generate_quote' else "Creating Approval Flow",
-                                        "message": "Creating your quote document..." if tool_call['tool_name'] == 'generate_quote' else "Setting up your approval workflow..."
-                                    }
-                                    await manager.send_personal_message(json.dumps(status_msg), client_id)
-                                    logger.info(f"Sent final buffer status for {tool_call['tool_name']} to client {client_id}")
-                                    
-                                    # Execute tool in background (without sending status again)
-                                    tool_call_with_id = {**tool_call, "message_id": current_message_id}
-                                    asyncio.create_task(execute_tool_only(tool_call_with_id, client_id))
-                            
-                            if new_tool_calls == 0:
-                                logger.debug("No new tool calls found in final buffer")
-                            
-                            # Stream any remaining safe content
-                            remaining_safe_content = get_safe_content_to_stream(content_buffer, streamed_length)
-                            if remaining_safe_content:
-                                remaining_chunk_msg = {
-                                    "type": "response_chunk",
-                                    "message_id": current_message_id,
-                                    "content": remaining_safe_content
-                                }
-                                await manager.send_personal_message(json.dumps(remaining_chunk_msg), client_id)
-                            
-                            # Remove tool calls from visible content for final message
-                            clean_content = remove_tool_calls_from_content(content_buffer)
-                            
-                            # Send final message
-                            final_msg = {
-                                "type": "response_complete",
-                                "message_id": current_message_id,
-                                "content": clean_content
-                            }
-                            await manager.send_personal_message(json.dumps(final_msg), client_id)
-                            break
+                        # Stream any remaining safe content
+                        remaining_safe_content = get_safe_content_to_stream(content_buffer, streamed_length)
+                        if remaining_safe_content:
+                            await manager.send_chunk(chunk_envelope, remaining_safe_content, client_id)
                         
-                        try:
-                            chunk = json.loads(data)
-                            if "choices" in chunk and len(chunk["choices"]) > 0:
-                                delta = chunk["choices"][0].get("delta", {})
-                                if "content" in delta:
-                                    content = delta["content"]
-                                    content_buffer += content
-                                    
-                                    # Debug: Log content buffer periodically (only for long responses)
-                                    if len(content_buffer) % 500 == 0:
-                                        logger.debug(f"Content buffer length: {len(content_buffer)}")
-                                    
-                                    # Check for complete tool calls in the buffer
-                                    tool_calls = extract_tool_calls(content_buffer)
-                                    for tool_call in tool_calls:
-                                        # Create a stable signature based on tool content
-                                        tool_signature = f"{tool_call['tool_name']}_{hash(json.dumps(tool_call['parameters'], sort_keys=True))}"
-                                        
-                                        if tool_signature not in tool_calls_processed:
-                                            tool_calls_processed.add(tool_signature)
-                                            logger.info(f"Extracted tool call: {tool_call['tool_name']} (executing)")
-                                            
-                                            # Send status immediately when tool is detected (during streaming)
-                                            status_msg = {
-                                                "type": "tool_status",
-                                                "message_id": current_message_id,
-                                                "tool_name": tool_call['tool_name'],
-                                                "status": "Generating Quote" if tool_call['tool_name'] == 'generate_quote' else "Creating Approval Flow",
-                                                "message": "Creating your quote document..." if tool_call['tool_name'] == 'generate_quote' else "Setting up your approval workflow..."
-                                            }
-                                            await manager.send_personal_message(json.dumps(status_msg), client_id)
-                                            logger.info(f"Sent immediate status for {tool_call['tool_name']} to client {client_id}")
-                                            
-                                            # Execute tool in background (without sending status again)
-                                            tool_call_with_id = {**tool_call, "message_id": current_message_id}
-                                            asyncio.create_task(execute_tool_only(tool_call_with_id, client_id))
-                                        else:
-                                            logger.debug(f"Skipping duplicate tool call: {tool_call['tool_name']}")
-                                    
-                                    # Determine what new content can be safely streamed
-                                    safe_content = get_safe_content_to_stream(content_buffer, streamed_length)
-                                    
-                                    if safe_content:
-                                        chunk_msg = {
-                                            "type": "response_chunk",
-                                            "message_id": current_message_id,
-                                            "content": safe_content
-                                        }
-                                        await manager.send_personal_message(json.dumps(chunk_msg), client_id)
-                                        streamed_length += len(safe_content)
+                        # Remove tool calls from visible content for final message
+                        clean_content = remove_tool_calls_from_content(content_buffer)
                         
-                        except json.JSONDecodeError:
-                            continue  # Skip malformed chunks
+                        # Send final message
+                        final_msg = {
+                            "type": "response_complete",
+                            "message_id": current_message_id,
+                            "content": clean_content
+                        }
+                        await manager.send_message(final_msg, client_id)
                         
-    except httpx.TimeoutException:
+                        if cache_key is not None:
+                            # Answers that triggered tools have side effects and must never be replayed
+                            if tool_calls_processed or '<tool_call' in content_buffer:
+                                response_cache.bypasses += 1
+                            else:
+                                response_cache.put(cache_key, clean_content)
+                        break
+                    
+                    try:
+                        chunk = codec.loads(data)
+                        if "choices" in chunk and len(chunk["choices"]) > 0:
+                            delta = chunk["choices"][0].get("delta", {})
+                            if "content" in delta:
+                                content = delta["content"]
+                                content_buffer += content
+                                
+                                # Debug: Log content buffer periodically (only for long responses)
+                                if len(content_buffer) % 500 == 0:
+                                    logger.debug(f"Content buffer length: {len(content_buffer)}")
+                                
+                                # Check for complete tool calls in the buffer
+                                await start_tool_calls(content_buffer, tool_calls_processed, current_message_id, client_id)
+                                
+                                # Determine what new content can be safely streamed
+                                safe_content = get_safe_content_to_stream(content_buffer, streamed_length)
+                                
+                                if safe_content:
+                                    await manager.send_chunk(chunk_envelope, safe_content, client_id)
+                                    streamed_length += len(safe_content)
+                    
+                    except codec.DecodeError:
+                        continue  # Skip malformed chunks
+        finally:
+            await response.aclose()
+                    
+    except UpstreamStatusError as e:
+        logger.error(f"OpenAI API error: {e.status_code} - {e.body}")
+        error_msg = {
+            "type": "error",
+            "message": f"OpenAI API error: {e.status_code}"
+        }
+        await manager.send_message(error_msg, client_id)
+    except (httpx.TimeoutException, asyncio.TimeoutError):
         error_msg = {
             "type": "error",
             "message": "Request to OpenAI timed out"
         }
-        await manager.send_personal_message(json.dumps(error_msg), client_id)
+        await manager.send_message(error_msg, client_id)
     except Exception as e:
         logger.error(f"Error streaming OpenAI response: {str(e)}")
         error_msg = {
             "type": "error",
             "message": f"Error processing request: {str(e)}"
         }
-        await manager.send_personal_message(json.dumps(error_msg), client_id)
+        await manager.send_message(error_msg, client_id)
+
+async def warm_up_upstream():
+    """Open pooled TLS connections to OpenAI so the first chat doesn't pay the handshake"""
+    client = get_http_client()
+    headers = {"Authorization": f"Bearer {OPENAI_API_KEY}"}
+    await asyncio.gather(*[
+        client.get(OPENAI_MODELS_URL, headers=headers, timeout=10.0)
+        for _ in range(WARMUP_UPSTREAM_CONNECTIONS)
+    ])
+
+def warm_up_pdf():
+    """Price and render a small throwaway quote so fonts, styles and pricing are loaded"""
+    parameters = {"customer_name": "Warm-up", "product": "Warm-up", "quantity": "1", "discount": "10%"}
+    quote_content = {"product_description": "Warm-up", "unit_price": 1.0, "terms": "-", "additional_notes": "-"}
+    create_quote_pdf(parameters, quote_content, build_quote_pricing(parameters, quote_content), "warmup", io.BytesIO())
+
+async def warm_up():
+    """Load the prompt, import heavy modules, render a dummy PDF and open upstream connections"""
+    started = time.perf_counter()
+    steps = [
+        ("prompt", lambda: asyncio.to_thread(load_system_prompt)),
+        ("imports", lambda: asyncio.to_thread(lambda: [timed_import(name) for name in HEAVY_MODULES])),
+        ("pdf", lambda: asyncio.to_thread(warm_up_pdf)),
+        ("supabase", lambda: asyncio.to_thread(get_supabase_client)),
+    ]
+    if OPENAI_API_KEY:
+        steps.append(("upstream", warm_up_upstream))
+    
+    step_timings = {}
+    for name, step in steps:
+        step_started = time.perf_counter()
+        try:
+            await step()
+        except Exception as e:
+            logger.warning(f"Warm-up step '{name}' failed: {e}")
+        step_timings[name] = round((time.perf_counter() - step_started) * 1000, 1)
+    
+    startup_timings["warmup_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    startup_timings["warmup_steps_ms"] = step_timings
+    startup_timings["ready"] = True
+    logger.info(f"Warm-up complete in {startup_timings['warmup_ms']}ms: {step_timings}; imports: {startup_timings['imports_ms']}")
+
+async def run_connection_task(state: ConnectionState, coro) -> bool:
+    """Run a connection's work to completion; False if it was cancelled (socket replaced or closed)"""
+    task = state.start_task(coro)
+    await asyncio.wait({task})
+    if task.cancelled():
+        return False
+    task.result()  # re-raise errors from the stream
+    return True
 
 @app.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
-    await manager.connect(websocket, client_id)
+    if manager.draining:
+        # Shutting down - send the client to another instance
+        await websocket.close(code=1012)
+        return
+    
+    # Clients may opt into binary MessagePack frames with ?codec=msgpack
+    requested_codec = websocket.query_params.get("codec")
+    wire_codec = codec.negotiate(requested_codec)
+    if requested_codec and wire_codec.name != requested_codec.lower():
+        logger.warning(f"Client {client_id} requested unavailable codec '{requested_codec}', using {wire_codec.name}")
+    
+    state = await manager.connect(websocket, client_id, wire_codec)
     
     try:
         while True:
-            # Receive message from client
-            data = await websocket.receive_text()
+            # Receive message from client (text or binary, depending on the codec)
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            state.touch()
+            data = frame["text"] if frame.get("text") is not None else frame.get("bytes")
             
             try:
-                message_data = json.loads(data)
-                logger.info(f"Received message from {client_id}: {message_data}")
+                message_data = wire_codec.decode(data)
+                log_event(logger, "ws.message", client_id=client_id,
+                          type=message_data.get("type") if isinstance(message_data, dict) else None, payload=message_data)
                 
                 # Extract message type
                 if "type" in message_data:
@@ -877,32 +2147,196 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
                             "content": user_message.get("content", "")
                         })
                         
-                        # Stream OpenAI response
-                        await stream_openai_response(messages, client_id)
+                        # Stream OpenAI response (as a task the connection owns, so a replacement can cancel it)
+                        if not await run_connection_task(state, stream_openai_response(messages, client_id)):
+                            break
                     
                     elif message_data["type"] == "ping":
                         # Respond to ping with pong
                         pong_msg = {"type": "pong"}
-                        await manager.send_personal_message(json.dumps(pong_msg), client_id)
+                        await manager.send_message(pong_msg, client_id)
                         
                 else:
                     # Legacy format support - treat as direct message
                     if "content" in message_data:
                         messages = [{"role": "user", "content": message_data["content"]}]
-                        await stream_openai_response(messages, client_id)
+                        if not await run_connection_task(state, stream_openai_response(messages, client_id)):
+                            break
                         
-            except json.JSONDecodeError:
+            except codec.DecodeError:
                 error_msg = {
                     "type": "error",
-                    "message": "Invalid JSON format"
+                    "message": f"Invalid {wire_codec.name.upper()} format"
                 }
-                await manager.send_personal_message(json.dumps(error_msg), client_id)
+                await manager.send_message(error_msg, client_id)
                 
     except WebSocketDisconnect:
-        manager.disconnect(client_id)
+        pass
     except Exception as e:
         logger.error(f"WebSocket error for {client_id}: {str(e)}")
-        manager.disconnect(client_id)
+    finally:
+        # A newer socket for the same client_id may already be registered; leave it alone
+        manager.disconnect(client_id, state)
+
+def is_not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """Evaluate If-None-Match / If-Modified-Since for a conditional GET"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in candidates or etag in candidates
+    
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+@app.get("/download/{filename}")
+async def download_pdf(filename: str, request: Request, expires: int = 0, token: str = ""):
+    """Serve a locally stored quote PDF (signed link; supports ETag, conditional GET and Range)"""
+    if SUPABASE_CONFIGURED:
+        # Quotes live in Supabase storage; there are no local links to verify
+        raise HTTPException(status_code=404, detail="File not found")
+    if expires < time.time() or not hmac.compare_digest(token.encode("utf-8"), sign_download(filename, expires).encode("ascii")):
+        raise HTTPException(status_code=403, detail="Download link is invalid or has expired")
+    
+    try:
+        path = local_pdf_path(filename)
+        stat_result = await asyncio.to_thread(os.stat, path)
+    except (ValueError, FileNotFoundError):
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    # Quote files are immutable once written, so mtime + size identifies the content
+    etag = f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Cache-Control": f"private, max-age={max(0, int(expires - time.time()))}"
+    }
+    if is_not_modified(request, etag, stat_result.st_mtime):
+        return Response(status_code=304, headers=headers)
+    
+    # FileResponse handles Range/If-Range and uses the ASGI pathsend (zero-copy) extension when the server offers it
+    return FileResponse(
+        path,
+        media_type="application/pdf",
+        filename=filename,
+        content_disposition_type="inline",
+        headers=headers,
+        stat_result=stat_result
+    )
+
+@app.post("/quotes/signed-urls")
+async def quote_signed_urls(request: SignedUrlRequest, client_id: str = Depends(require_principal)):
+    """Fresh download URLs for a list of the client's quote ids (cached URLs reused, the rest signed in bulk)"""
+    if len(request.quote_ids) > 1000:
+        raise HTTPException(status_code=400, detail="At most 1000 quote_ids per request")
+    
+    quote_ids = list(dict.fromkeys(qid for qid in request.quote_ids if QUOTE_ID_RE.match(qid)))
+    paths = await resolve_quote_object_paths(quote_ids, client_id)
+    urls = await get_signed_urls(list(paths.values()))
+    
+    signed = {quote_id: urls[path] for quote_id, path in paths.items() if path in urls}
+    return {
+        "urls": {quote_id: url for quote_id, (url, _) in signed.items()},
+        "missing": [quote_id for quote_id in request.quote_ids if quote_id not in signed],
+        # Cached URLs can be older than SIGNED_URL_TTL: report the soonest real expiry
+        "expires_in": url_expires_in(min((expires_at for _, expires_at in signed.values()), default=None))
+    }
+
+@app.post("/quotes", status_code=202)
+async def create_quote(params: GenerateQuoteParams, client_id: str = Depends(require_principal)):
+    """Queue a quote from structured parameters (e.g. thousands of line items) without the chat LLM; poll /jobs/{job_id}"""
+    job_id = await submit_tool_job(
+        {"tool_name": "generate_quote", "parameters": params.model_dump(exclude_none=True)}, client_id
+    )
+    return {"job_id": job_id, "status": JOB_QUEUED}
+
+@app.get("/quotes")
+async def list_quotes(customer: Optional[str] = None, product: Optional[str] = None,
+                      since: Optional[float] = None, before: Optional[float] = None, limit: int = 50,
+                      client_id: str = Depends(require_principal)):
+    """The client's indexed quote history, newest first; page with before=<created_at of the last result>"""
+    quotes = await asyncio.to_thread(
+        quote_index.search, client_id, customer, product, since, before, min(max(limit, 1), 500)
+    )
+    return {
+        "quotes": quotes,
+        "next_before": quotes[-1]["created_at"] if quotes else None
+    }
+
+@app.get("/quotes/{quote_id}")
+async def get_quote(quote_id: str, client_id: str = Depends(require_principal)):
+    quote = await asyncio.to_thread(quote_index.get, quote_id)
+    if quote is None or quote["client_id"] != client_id:
+        raise HTTPException(status_code=404, detail="Quote not found")
+    return quote
+
+@app.post("/quotes/{quote_id}/reissue")
+async def reissue_quote(quote_id: str, client_id: str = Depends(require_principal)):
+    """Fresh download URL for one of the client's quotes: re-signs the stored PDF, no LLM or render work"""
+    quote = await asyncio.to_thread(quote_index.get, quote_id)
+    if quote is None or quote["client_id"] != client_id:
+        raise HTTPException(status_code=404, detail="Quote not found")
+    path = quote["object_path"]
+    if not SUPABASE_CONFIGURED and not await asyncio.to_thread(os.path.exists, local_pdf_path(path)):
+        raise HTTPException(status_code=410, detail="The quote PDF has been removed from local storage")
+    
+    urls = await get_signed_urls([path])
+    if path not in urls:
+        raise HTTPException(status_code=410, detail="The quote PDF is no longer in storage")
+    url, expires_at = urls[path]
+    return {**quote, "url": url, "expires_in": url_expires_in(expires_at)}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, client_id: str = Depends(require_principal)):
+    """Return the current state of one of the client's tool jobs"""
+    job = await asyncio.to_thread(tool_queue.get, job_id)
+    if job is None or job['client_id'] != client_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {
+        "job_id": job['job_id'],
+        "tool_name": job['tool_name'],
+        "status": job['status'],
+        "attempts": job['attempts'],
+        "message_id": job['message_id'],
+        "result": job['result'],
+        "error": job['error'],
+        "created_at": job['created_at'],
+        "updated_at": job['updated_at']
+    }
+
+@app.get("/workflows/{workflow_id}")
+async def get_workflow(workflow_id: str, principal: str = Depends(require_principal)):
+    """Return an approval workflow with its steps, to its creator or one of its approvers"""
+    workflow = await asyncio.to_thread(workflow_store.get, workflow_id)
+    if workflow is None or not is_participant(workflow, principal):
+        raise HTTPException(status_code=404, detail="Workflow not found")
+    return workflow
+
+@app.post("/workflows/{workflow_id}/decisions")
+async def decide_workflow_step(workflow_id: str, request: WorkflowDecisionRequest,
+                               principal: str = Depends(require_principal)):
+    """Approve or reject the caller's step in the workflow's current stage (the API key names the approver)"""
+    try:
+        workflow = await asyncio.to_thread(
+            workflow_store.decide, workflow_id, principal, request.decision, request.comment
+        )
+    except WorkflowError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if workflow is None:
+        raise HTTPException(status_code=404, detail="Workflow not found")
+    return workflow
+
+@app.get("/approvers/{approver}/pending")
+async def approver_pending_steps(approver: str, limit: int = 100, principal: str = Depends(require_principal)):
+    """Workflow steps currently waiting on an approver (only the approver's own key may list them)"""
+    if approver_key(approver) != approver_key(principal):
+        raise HTTPException(status_code=403, detail="An approver's pending steps are only visible to that approver")
+    steps = await asyncio.to_thread(workflow_store.pending_for_approver, approver, min(max(limit, 1), 1000))
+    return {"approver": approver, "pending": steps}
 
 @app.get("/")
 async def root():
@@ -914,10 +2348,25 @@ async def root():
 
 @app.get("/health")
 async def health_check():
+    if manager.draining:
+        return JSONResponse(status_code=503, content={"status": "draining"})
+    if not startup_timings["ready"]:
+        return JSONResponse(status_code=503, content={"status": "starting", "startup": startup_timings})
+    
     return {
         "status": "healthy",
         "active_connections": len(manager.active_connections),
-        "openai_configured": bool(OPENAI_API_KEY)
+        "connections": manager.snapshot(),
+        "openai_configured": bool(OPENAI_API_KEY),
+        "upstream": upstream_stats.snapshot(),
+        "models": model_router.snapshot(),
+        "response_cache": response_cache.snapshot(),
+        "signed_urls": signed_url_cache.snapshot(),
+        "tool_jobs": await asyncio.to_thread(tool_queue.stats),
+        "workflows": await asyncio.to_thread(workflow_store.stats),
+        "quote_index": await asyncio.to_thread(quote_index.stats),
+        "startup": startup_timings,
+        "logging": logging_stats()
     }
 
 if __name__ == "__main__":
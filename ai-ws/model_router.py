@@ -0,0 +1,142 @@
+"""
+Model routing for upstream LLM calls.
+
+Each call site ("chat", "quote_content") has an ordered list of model tiers,
+a latency budget and a shared error budget. The router tracks the observed
+latency and outcome of recent calls per model and orders the candidates for
+a call so that healthy models within budget come first: a model that keeps
+failing is put in a cool-down, and one that is over its latency or error
+budget is only tried after the others. Demoted models recover: the window is
+cleared when a cool-down ends, and a model over budget is probed first once
+per cool-down period; a successful probe clears its window.
+"""
+import logging
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class ModelStats:
+    """Recent outcomes for one model (__slots__: one instance per configured model)"""
+    __slots__ = ("latencies", "outcomes", "calls", "failures", "consecutive_failures", "cooldown_until",
+                 "last_tried", "probe_pending")
+
+    def __init__(self, window: int):
+        self.latencies = deque(maxlen=window)  # seconds, successful calls only
+        self.outcomes = deque(maxlen=window)  # True for success
+        self.calls = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.last_tried = 0.0
+        self.probe_pending = False
+
+    def reset_window(self):
+        self.outcomes.clear()
+        self.latencies.clear()
+        self.consecutive_failures = 0
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+    def error_rate(self) -> float:
+        return (len(self.outcomes) - sum(self.outcomes)) / len(self.outcomes) if self.outcomes else 0.0
+
+class ModelRouter:
+    def __init__(self, routes: Dict[str, List[str]], latency_budgets: Dict[str, float], error_budget: float = 0.2,
+                 window: int = 50, min_samples: int = 5, failure_threshold: int = 3, cooldown: float = 60.0):
+        self.routes = routes
+        self.latency_budgets = latency_budgets
+        self.error_budget = error_budget
+        self.window = window
+        self.min_samples = min_samples
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.stats: Dict[str, ModelStats] = {}
+        self.fallbacks = 0
+        self.probes = 0
+
+    def _stats(self, model: str) -> ModelStats:
+        stats = self.stats.get(model)
+        if stats is None:
+            stats = self.stats[model] = ModelStats(self.window)
+        return stats
+
+    def primary(self, call_site: str) -> str:
+        return self.routes[call_site][0]
+
+    def candidates(self, call_site: str, probe: bool = True) -> List[str]:
+        """The call site's models in the order they should be tried (probe=False for reporting only)"""
+        now = time.monotonic()
+        budget = self.latency_budgets.get(call_site)
+        probes, within, over_budget, cooling = [], [], [], []
+        for model in self.routes[call_site]:
+            stats = self._stats(model)
+            if stats.cooldown_until > now:
+                cooling.append(model)
+                continue
+            if stats.cooldown_until:
+                # Cool-down over: judge the model on fresh calls only
+                stats.cooldown_until = 0.0
+                stats.reset_window()
+            if len(stats.outcomes) >= self.min_samples and (
+                stats.error_rate() > self.error_budget
+                or (budget is not None and (stats.percentile(0.9) or 0.0) > budget)
+            ):
+                if probe and now - stats.last_tried >= self.cooldown and not stats.probe_pending:
+                    # Not tried for a cool-down period: send this call to it as a probe
+                    stats.probe_pending = True
+                    stats.last_tried = now
+                    self.probes += 1
+                    probes.append(model)
+                else:
+                    over_budget.append(model)
+            else:
+                within.append(model)
+        # Probes go first so they are actually sent; models over budget or cooling down are
+        # still tried last rather than failing the call outright
+        return probes + within + over_budget + cooling
+
+    def record(self, model: str, seconds: float, ok: bool):
+        stats = self._stats(model)
+        stats.last_tried = time.monotonic()
+        if stats.probe_pending:
+            stats.probe_pending = False
+            if ok:
+                stats.reset_window()
+        stats.calls += 1
+        stats.outcomes.append(ok)
+        if ok:
+            stats.latencies.append(seconds)
+            stats.consecutive_failures = 0
+            return
+        stats.failures += 1
+        stats.consecutive_failures += 1
+        if stats.consecutive_failures >= self.failure_threshold:
+            stats.cooldown_until = time.monotonic() + self.cooldown
+            logger.warning(f"Model {model} failed {stats.consecutive_failures} times in a row, cooling down for {self.cooldown:.0f}s")
+
+    def snapshot(self) -> Dict:
+        now = time.monotonic()
+        models = {}
+        for model, stats in self.stats.items():
+            p50 = stats.percentile(0.5)
+            p90 = stats.percentile(0.9)
+            models[model] = {
+                "calls": stats.calls,
+                "failures": stats.failures,
+                "error_rate": round(stats.error_rate(), 3),
+                "latency_p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                "latency_p90_ms": round(p90 * 1000, 1) if p90 is not None else None,
+                "cooling_down": stats.cooldown_until > now
+            }
+        return {
+            "routes": {site: self.candidates(site, probe=False) for site in self.routes},
+            "fallbacks": self.fallbacks,
+            "probes": self.probes,
+            "models": models
+        }
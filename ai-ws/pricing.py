@@ -0,0 +1,174 @@
+"""
+Quote pricing over column-wise line items.
+
+Line items are held as parallel columns (quantity, unit price, discount...)
+rather than one dict per row, and subtotals, volume-tier discounts, taxes and
+totals are computed for all lines in one pass: with numpy when it is installed
+(``pip install .[fast]``), otherwise with a pure-Python fallback that gives
+the same results. numpy is imported on first use so it adds nothing to startup.
+
+Money is computed in integer cents, never in binary floats: quantities and unit
+prices are taken as fixed-point integers (1/10000ths) and rates as parts per
+million, and every rounding step is an exact integer half-up division.
+"""
+import importlib.util
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Optional speed-up; only probed here, imported by the first numpy pricing run
+PRICING_BACKEND = "numpy" if importlib.util.find_spec("numpy") is not None else "python"
+
+AMOUNT_SCALE = 10_000  # quantity and unit price precision: 4 decimal places
+RATE_SCALE = 1_000_000  # discount and tax rate precision: parts per million
+# quantity * unit price is in 1/10^8ths; dividing by this gives cents
+SUBTOTAL_SCALE = AMOUNT_SCALE * AMOUNT_SCALE // 100
+# Largest scaled quantity * unit price the numpy backend may form without int64 overflow
+NUMPY_SAFE_PRODUCT = 2 ** 62
+
+NUMBER_RE = re.compile(r"-?\d[\d,]*(?:\.\d+)?")
+
+def parse_number(value, default: float = 0.0) -> float:
+    """First number in "1,200", "$99.50" or "100 seats"; default when there is none"""
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = NUMBER_RE.search(str(value))
+    return float(match.group(0).replace(",", "")) if match else default
+
+def parse_rate(value) -> Optional[float]:
+    """Percentage ("25%", "25", 25) as a fraction clamped to [0, 1]; None when absent or not numeric"""
+    if value is None or str(value).strip().lower() in ("", "none", "n/a"):
+        return None
+    if not NUMBER_RE.search(str(value)):
+        return None
+    return min(max(parse_number(value) / 100.0, 0.0), 1.0)
+
+def div_half_up(numerator: int, denominator: int) -> int:
+    """Integer division rounding half up (towards +inf), i.e. floor(n / d + 1/2), for even d"""
+    return (numerator + denominator // 2) // denominator
+
+def parse_tiers(spec: str) -> List[Tuple[float, float]]:
+    """"100:5,500:10" -> [(100, 0.05), (500, 0.10)] sorted by minimum quantity"""
+    tiers = []
+    for item in spec.split(","):
+        if ":" in item:
+            min_quantity, percent = item.split(":", 1)
+            tiers.append((float(min_quantity), float(percent) / 100.0))
+    return sorted(tiers)
+
+class LineItems:
+    """Quote line items stored column-wise; discount is NaN where the line has no explicit discount"""
+    __slots__ = ("sku", "description", "quantity", "unit_price", "discount")
+
+    def __init__(self, sku: List[str], description: List[str], quantity: List[float],
+                 unit_price: List[float], discount: List[float]):
+        self.sku = sku
+        self.description = description
+        self.quantity = quantity
+        self.unit_price = unit_price
+        self.discount = discount
+
+    def __len__(self) -> int:
+        return len(self.quantity)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict], default_unit_price: float, default_description: str = "Item") -> "LineItems":
+        sku, description, quantity, unit_price, discount = [], [], [], [], []
+        for row in rows:
+            sku.append(str(row.get("sku") or ""))
+            description.append(str(row.get("description") or row.get("product") or default_description))
+            quantity.append(parse_number(row.get("quantity"), 1.0))
+            unit_price.append(parse_number(row.get("unit_price"), default_unit_price))
+            rate = parse_rate(row.get("discount"))
+            discount.append(float("nan") if rate is None else rate)
+        return cls(sku, description, quantity, unit_price, discount)
+
+class QuotePricing:
+    """Per-line pricing columns plus quote totals"""
+    __slots__ = ("items", "subtotal", "discount_rate", "discount", "tax", "total", "totals")
+
+    def __init__(self, items: LineItems, subtotal: List[float], discount_rate: List[float],
+                 discount: List[float], tax: List[float], total: List[float], totals: Dict):
+        self.items = items
+        self.subtotal = subtotal
+        self.discount_rate = discount_rate
+        self.discount = discount
+        self.tax = tax
+        self.total = total
+        self.totals = totals
+
+def _price_numpy(items: LineItems, tiers: Sequence[Tuple[float, float]], order_discount: float, tax_rate: float):
+    import numpy as np
+    
+    def div_half_up_array(numerator, denominator: int):
+        return (numerator + denominator // 2) // denominator
+    
+    quantity = np.asarray(items.quantity, dtype=np.float64)
+    explicit = np.asarray(items.discount, dtype=np.float64)
+    scaled_quantity = np.rint(quantity * AMOUNT_SCALE).astype(np.int64)
+    scaled_price = np.rint(np.asarray(items.unit_price, dtype=np.float64) * AMOUNT_SCALE).astype(np.int64)
+    if len(items) and int(np.abs(scaled_quantity).max()) * int(np.abs(scaled_price).max()) > NUMPY_SAFE_PRODUCT:
+        raise OverflowError("line amounts too large for int64 pricing")
+
+    subtotal = div_half_up_array(scaled_quantity * scaled_price, SUBTOTAL_SCALE)
+    if tiers:
+        thresholds = np.array([0.0] + [t[0] for t in tiers])
+        rates = np.array([0.0] + [t[1] for t in tiers])
+        tier_rate = rates[np.searchsorted(thresholds, quantity, side="right") - 1]
+    else:
+        tier_rate = np.zeros_like(quantity)
+    rate = np.where(np.isnan(explicit), np.maximum(tier_rate, order_discount), explicit)
+    discount = div_half_up_array(subtotal * np.rint(rate * RATE_SCALE).astype(np.int64), RATE_SCALE)
+    tax = div_half_up_array((subtotal - discount) * round(tax_rate * RATE_SCALE), RATE_SCALE)
+    total = subtotal - discount + tax
+    return subtotal.tolist(), rate.tolist(), discount.tolist(), tax.tolist(), total.tolist()
+
+def _price_python(items: LineItems, tiers: Sequence[Tuple[float, float]], order_discount: float, tax_rate: float):
+    subtotal = [div_half_up(round(q * AMOUNT_SCALE) * round(p * AMOUNT_SCALE), SUBTOTAL_SCALE)
+                for q, p in zip(items.quantity, items.unit_price)]
+    rate = []
+    for q, explicit in zip(items.quantity, items.discount):
+        if explicit == explicit:  # not NaN
+            rate.append(explicit)
+            continue
+        tier_rate = 0.0
+        for min_quantity, tier in tiers:
+            if q < min_quantity:
+                break
+            tier_rate = tier
+        rate.append(max(tier_rate, order_discount))
+    discount = [div_half_up(s * round(r * RATE_SCALE), RATE_SCALE) for s, r in zip(subtotal, rate)]
+    scaled_tax_rate = round(tax_rate * RATE_SCALE)
+    tax = [div_half_up((s - d) * scaled_tax_rate, RATE_SCALE) for s, d in zip(subtotal, discount)]
+    total = [s - d + t for s, d, t in zip(subtotal, discount, tax)]
+    return subtotal, rate, discount, tax, total
+
+def price_line_items(items: LineItems, tiers: Sequence[Tuple[float, float]] = (), order_discount: float = 0.0,
+                     tax_rate: float = 0.0, backend: str = PRICING_BACKEND) -> QuotePricing:
+    """Price every line at once.
+
+    A line's discount is its explicit discount when it has one, otherwise the
+    larger of its volume tier and the quote-level discount (they do not stack).
+    Amounts are rounded to cents per line and totals are sums of the rounded lines.
+    """
+    prices = None
+    if backend == "numpy" and PRICING_BACKEND == "numpy":
+        try:
+            prices = _price_numpy(items, tiers, order_discount, tax_rate)
+        except OverflowError:
+            pass  # Python ints do not overflow
+    if prices is None:
+        prices = _price_python(items, tiers, order_discount, tax_rate)
+    subtotal, rate, discount, tax, total = prices
+
+    totals = {
+        "line_count": len(items),
+        "subtotal": sum(subtotal) / 100,
+        "discount": sum(discount) / 100,
+        "tax": sum(tax) / 100,
+        "tax_rate": tax_rate,
+        "total": sum(total) / 100
+    }
+    return QuotePricing(items, [c / 100 for c in subtotal], rate, [c / 100 for c in discount],
+                        [c / 100 for c in tax], [c / 100 for c in total], totals)
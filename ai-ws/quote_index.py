@@ -0,0 +1,111 @@
+"""
+Local index of generated quotes.
+
+execute_generate_quote records every quote it stores (customer, product,
+totals and the storage object path), so past quotes can be listed by customer
+or product and re-issued with a fresh signed URL without listing the storage
+bucket or regenerating anything.
+"""
+import logging
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS quotes (
+    quote_id TEXT PRIMARY KEY,
+    client_id TEXT,
+    customer TEXT NOT NULL,
+    customer_key TEXT NOT NULL,
+    quote_name TEXT,
+    product TEXT,
+    product_key TEXT,
+    quantity REAL,
+    discount TEXT,
+    line_count INTEGER NOT NULL DEFAULT 1,
+    total REAL NOT NULL,
+    object_path TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_quotes_client_customer ON quotes(client_id, customer_key, created_at);
+CREATE INDEX IF NOT EXISTS idx_quotes_client_product ON quotes(client_id, product_key, created_at);
+CREATE INDEX IF NOT EXISTS idx_quotes_client_created ON quotes(client_id, created_at);
+DROP INDEX IF EXISTS idx_quotes_customer;
+DROP INDEX IF EXISTS idx_quotes_product;
+DROP INDEX IF EXISTS idx_quotes_created;
+"""
+
+COLUMNS = ("quote_id", "client_id", "customer", "quote_name", "product", "quantity", "discount",
+           "line_count", "total", "object_path", "created_at")
+
+def search_key(value: Optional[str]) -> Optional[str]:
+    """Case- and whitespace-insensitive form used for customer/product lookups"""
+    return " ".join(value.lower().split()) if value else None
+
+class QuoteIndex(SQLiteStore):
+    """Quote records stored in a local SQLite database (WAL mode, safe across processes)"""
+    def __init__(self, path: str):
+        super().__init__(path, SCHEMA)
+
+    @staticmethod
+    def _row_to_quote(row: sqlite3.Row) -> Dict:
+        return {column: row[column] for column in COLUMNS}
+
+    def add(self, quote_id: str, customer: str, product: Optional[str], quantity: Optional[float],
+            discount: Optional[str], total: float, object_path: str, line_count: int = 1,
+            quote_name: Optional[str] = None, client_id: Optional[str] = None):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO quotes (quote_id, client_id, customer, customer_key, quote_name, product, product_key, "
+            "quantity, discount, line_count, total, object_path, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (quote_id, client_id, customer, search_key(customer), quote_name, product, search_key(product),
+             quantity, discount, line_count, total, object_path, time.time())
+        )
+
+    def get(self, quote_id: str) -> Optional[Dict]:
+        row = self._conn().execute("SELECT * FROM quotes WHERE quote_id = ?", (quote_id,)).fetchone()
+        return self._row_to_quote(row) if row else None
+
+    def object_paths(self, quote_ids: Iterable[str], batch_size: int = 500) -> Dict[str, Tuple[str, Optional[str]]]:
+        """quote_id -> (object path, owning client_id) for the ids that are indexed"""
+        quote_ids = list(quote_ids)
+        paths = {}
+        for start in range(0, len(quote_ids), batch_size):
+            batch = quote_ids[start:start + batch_size]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn().execute(
+                f"SELECT quote_id, object_path, client_id FROM quotes WHERE quote_id IN ({placeholders})", batch
+            ).fetchall()
+            paths.update((row["quote_id"], (row["object_path"], row["client_id"])) for row in rows)
+        return paths
+
+    def search(self, client_id: str, customer: Optional[str] = None, product: Optional[str] = None,
+               since: Optional[float] = None, before: Optional[float] = None, limit: int = 50) -> List[Dict]:
+        """The client's newest quotes first, filtered by exact customer/product (case-insensitive) and time range.
+
+        Pass the created_at of the last result as ``before`` to fetch the next page.
+        """
+        clauses, args = ["client_id = ?"], [client_id]
+        if customer:
+            clauses.append("customer_key = ?")
+            args.append(search_key(customer))
+        if product:
+            clauses.append("product_key = ?")
+            args.append(search_key(product))
+        if since is not None:
+            clauses.append("created_at >= ?")
+            args.append(since)
+        if before is not None:
+            clauses.append("created_at < ?")
+            args.append(before)
+        rows = self._conn().execute(
+            f"SELECT * FROM quotes WHERE {' AND '.join(clauses)} ORDER BY created_at DESC LIMIT ?", (*args, limit)
+        ).fetchall()
+        return [self._row_to_quote(row) for row in rows]
+
+    def stats(self) -> Dict[str, int]:
+        row = self._conn().execute("SELECT COUNT(*) AS count FROM quotes").fetchone()
+        return {"quotes": row["count"]}
@@ -0,0 +1,26 @@
+"""
+Shared SQLite plumbing for the local stores (job queue, quote index, workflows).
+
+Each store keeps one connection per thread, since sqlite3 connections are bound
+to the thread that opened them and store calls arrive via asyncio.to_thread.
+Connections run in autocommit mode with WAL, so readers never block the writer
+and several server processes can share one database file.
+"""
+import sqlite3
+import threading
+
+class SQLiteStore:
+    def __init__(self, path: str, schema: str):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript(schema)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
@@ -2,6 +2,8 @@
 """
 Startup script for the AI WebSocket service
 """
+import argparse
+import importlib.util
 import os
 import sys
 from pathlib import Path
@@ -30,20 +32,62 @@ if not os.getenv('OPENAI_API_KEY'):
     print("   The service will start but AI responses will not work")
     print()
 
+def available(module_name: str) -> bool:
+    return importlib.util.find_spec(module_name) is not None
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the AI WebSocket service")
+    parser.add_argument("--prod", action="store_true", default=os.getenv("APP_ENV") == "production",
+                        help="Production mode: multiple workers, uvloop/httptools, graceful drain (default when APP_ENV=production)")
+    parser.add_argument("--reload", action="store_true", help="Development auto-reload on file changes")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "0")),
+                        help="Worker processes in production mode (default: WEB_CONCURRENCY or CPU count)")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    return parser.parse_args()
+
+def production_options(args) -> dict:
+    """uvicorn settings for production: one worker per core and the fast loop/parser"""
+    try:
+        cpu_count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpu_count = os.cpu_count() or 1
+    drain_timeout = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "25"))
+    
+    return {
+        "workers": args.workers or cpu_count,
+        "loop": "uvloop" if available("uvloop") else "auto",
+        "http": "httptools" if available("httptools") else "auto",
+        "ws_ping_interval": float(os.getenv("WS_PING_INTERVAL", "20")),
+        "ws_ping_timeout": float(os.getenv("WS_PING_TIMEOUT", "20")),
+        "ws_max_size": int(os.getenv("WS_MAX_SIZE", str(4 * 1024 * 1024))),
+        # Token frames are tiny; compressing each one costs more CPU than it saves
+        "ws_per_message_deflate": os.getenv("WS_PER_MESSAGE_DEFLATE", "false").lower() == "true",
+        "timeout_graceful_shutdown": int(drain_timeout) + 5,
+        "proxy_headers": True,
+        "access_log": False,
+    }
+
 if __name__ == "__main__":
     import uvicorn
-    from main import app
+    
+    args = parse_args()
+    options = {"reload": args.reload} if not args.prod else production_options(args)
     
     print("🚀 Starting AI WebSocket Service...")
-    print("📡 WebSocket endpoint: ws://localhost:8000/ws/{client_id}")
-    print("🌐 HTTP health check: http://localhost:8000/health")
+    if args.prod:
+        print(f"🏭 Production mode: {options['workers']} workers, loop={options['loop']}, http={options['http']}")
+    elif args.reload:
+        print("🔁 Auto-reload enabled")
+    print(f"📡 WebSocket endpoint: ws://localhost:{args.port}/ws/{{client_id}}")
+    print(f"🌐 HTTP health check: http://localhost:{args.port}/health")
     print("🛑 Press Ctrl+C to stop")
     print()
     
     uvicorn.run(
-        app, 
-        host="0.0.0.0", 
-        port=8000, 
-        reload=True,
-        log_level="info"
-    ) 
\ No newline at end of file
+        "main:app",
+        host=args.host,
+        port=args.port,
+        log_level="info",
+        **options
+    )
@@ -0,0 +1,87 @@
+import random
+
+import pytest
+
+import pricing
+
+BACKENDS = ["python"] + (["numpy"] if pricing.PRICING_BACKEND == "numpy" else [])
+
+def price_one(quantity, unit_price, backend, discount=None, order_discount=0.0, tax_rate=0.0):
+    items = pricing.LineItems.from_rows([{"quantity": quantity, "unit_price": unit_price, "discount": discount}], 0.0)
+    return pricing.price_line_items(items, order_discount=order_discount, tax_rate=tax_rate, backend=backend)
+
+def test_div_half_up():
+    assert pricing.div_half_up(34965, 10) == 3497
+    assert pricing.div_half_up(5, 10) == 1
+    assert pricing.div_half_up(4, 10) == 0
+    assert pricing.div_half_up(-5, 10) == 0
+    assert pricing.div_half_up(-6, 10) == -1
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_ten_percent_of_349_65_rounds_up(backend):
+    # 34.965 is 34.964999... as a binary float
+    quote = price_one(1, 349.65, backend, order_discount=0.10)
+    assert quote.discount == [34.97]
+    assert quote.totals["total"] == 314.68
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("quantity, unit_price, subtotal", [
+    (1, 0.125, 0.13),
+    (3, 0.335, 1.01),
+    (1.5, 2.01, 3.02),
+    (7, 1.005, 7.04),
+    (2, 0.0049, 0.01),
+    (1, 0.0049, 0.0),
+])
+def test_half_cent_subtotals(backend, quantity, unit_price, subtotal):
+    assert price_one(quantity, unit_price, backend).subtotal == [subtotal]
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("unit_price, rate, discount", [
+    (10.05, "50%", 5.03),
+    (1.15, "10%", 0.12),
+    (0.05, "10%", 0.01),
+    (0.04, "12.5%", 0.01),
+    (100.10, "2.5%", 2.5),
+])
+def test_half_cent_discounts(backend, unit_price, rate, discount):
+    assert price_one(1, unit_price, backend, discount=rate).discount == [discount]
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_half_cent_tax(backend):
+    # (20.10 - 0) * 8.25% = 1.65825 -> 1.66; (1.30) * 8.25% = 0.10725 -> 0.11
+    assert price_one(1, 20.10, backend, tax_rate=0.0825).tax == [1.66]
+    assert price_one(1, 1.30, backend, tax_rate=0.0825).tax == [0.11]
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_totals_are_sums_of_rounded_lines(backend):
+    rows = [{"quantity": 1, "unit_price": 0.005}] * 3
+    quote = pricing.price_line_items(pricing.LineItems.from_rows(rows, 0.0), backend=backend)
+    assert quote.subtotal == [0.01, 0.01, 0.01]
+    assert quote.totals["subtotal"] == 0.03
+
+@pytest.mark.skipif(pricing.PRICING_BACKEND != "numpy", reason="numpy is not installed")
+def test_numpy_and_python_backends_agree():
+    rng = random.Random(39)
+    rows = []
+    for _ in range(5000):
+        row = {
+            "quantity": rng.choice([rng.randint(1, 2000), round(rng.uniform(0.5, 50), 2)]),
+            "unit_price": round(rng.uniform(0.001, 5000), rng.choice([2, 3, 4])),
+        }
+        if rng.random() < 0.3:
+            row["discount"] = f"{rng.choice([5, 7.5, 10, 12.5, 33, 50])}%"
+        rows.append(row)
+    items = pricing.LineItems.from_rows(rows, 0.0)
+    tiers = pricing.parse_tiers("100:5,500:10,1000:15")
+    numpy_quote = pricing.price_line_items(items, tiers, 0.035, 0.0825, backend="numpy")
+    python_quote = pricing.price_line_items(items, tiers, 0.035, 0.0825, backend="python")
+    for column in ("subtotal", "discount_rate", "discount", "tax", "total"):
+        assert getattr(numpy_quote, column) == getattr(python_quote, column), column
+    assert numpy_quote.totals == python_quote.totals
+
+@pytest.mark.skipif(pricing.PRICING_BACKEND != "numpy", reason="numpy is not installed")
+def test_numpy_overflow_falls_back_to_python():
+    quote = price_one(10**9, 10**9, "numpy", order_discount=0.10)
+    assert quote.subtotal == [1e18]
+    assert quote.discount == [1e17]
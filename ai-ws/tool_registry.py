@@ -0,0 +1,118 @@
+"""
+Registry of tools the assistant can call.
+
+Each tool declares its parameter schema, whether its blocking work is CPU- or
+IO-bound (which decides the thread pool it runs on), a timeout, a per-process
+concurrency limit and the status text shown while it runs. The streaming loop
+and the job workers only talk to the registry, so adding a tool means
+registering a ToolSpec.
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional, Type
+
+from pydantic import BaseModel, ValidationError
+
+logger = logging.getLogger(__name__)
+
+TOOL_KIND_CPU = "cpu"
+TOOL_KIND_IO = "io"
+
+# Tool currently executing in this task, so run_blocking() can pick its pool
+current_tool: contextvars.ContextVar[Optional["ToolSpec"]] = contextvars.ContextVar("current_tool", default=None)
+
+@dataclass
+class ToolSpec:
+    name: str
+    handler: Callable[[Dict, str], Awaitable[Dict]]
+    parameters: Type[BaseModel]
+    kind: str = TOOL_KIND_IO
+    timeout: float = 60.0
+    max_concurrency: int = 8
+    status: str = "Working"
+    status_message: str = "Working on it..."
+
+class ToolRegistry:
+    """Looks up, validates and runs tools with per-tool limits and per-kind thread pools"""
+    def __init__(self, cpu_workers: int, io_workers: int):
+        self.tools: Dict[str, ToolSpec] = {}
+        self.executors = {
+            TOOL_KIND_CPU: ThreadPoolExecutor(max_workers=cpu_workers, thread_name_prefix="tool-cpu"),
+            TOOL_KIND_IO: ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="tool-io"),
+        }
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def register(self, spec: ToolSpec) -> ToolSpec:
+        if spec.kind not in self.executors:
+            raise ValueError(f"Unknown tool kind for {spec.name}: {spec.kind}")
+        self.tools[spec.name] = spec
+        self._semaphores[spec.name] = asyncio.Semaphore(spec.max_concurrency)
+        return spec
+
+    def get(self, tool_name: str) -> Optional[ToolSpec]:
+        return self.tools.get(tool_name)
+
+    def concurrency_limits(self) -> Dict[str, int]:
+        """max_concurrency per tool, for job workers to stop claiming a tool that is at its limit"""
+        return {name: spec.max_concurrency for name, spec in self.tools.items()}
+
+    def status_frame(self, tool_name: str, message_id: str) -> Dict:
+        """tool_status frame sent as soon as a tool call is detected in the stream"""
+        spec = self.tools.get(tool_name)
+        return {
+            "type": "tool_status",
+            "message_id": message_id,
+            "tool_name": tool_name,
+            "status": spec.status if spec else "Working",
+            "message": spec.status_message if spec else f"Running {tool_name}..."
+        }
+
+    async def run_blocking(self, fn: Callable, *args, **kwargs):
+        """Run blocking work on the pool matching the calling tool's kind (IO pool outside a tool)"""
+        spec = current_tool.get()
+        executor = self.executors[spec.kind if spec else TOOL_KIND_IO]
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+    async def execute(self, tool_call: Dict, client_id: str) -> Dict:
+        """Validate parameters and run a tool under its concurrency limit and timeout"""
+        tool_name = tool_call['tool_name']
+        spec = self.tools.get(tool_name)
+        if spec is None:
+            logger.error(f"Unknown tool: {tool_name}")
+            return {
+                'success': False,
+                'error': f"Unknown tool: {tool_name}"
+            }
+
+        try:
+            parameters = spec.parameters.model_validate(tool_call['parameters']).model_dump(exclude_none=True)
+        except ValidationError as e:
+            errors = "; ".join(f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors())
+            return {
+                'success': False,
+                'tool_name': tool_name,
+                'error': f"Invalid parameters for {tool_name}: {errors}"
+            }
+
+        async with self._semaphores[tool_name]:
+            token = current_tool.set(spec)
+            try:
+                return await asyncio.wait_for(spec.handler(parameters, client_id), timeout=spec.timeout)
+            except asyncio.TimeoutError:
+                logger.error(f"Tool {tool_name} timed out after {spec.timeout:g}s for client {client_id}")
+                return {
+                    'success': False,
+                    'tool_name': tool_name,
+                    'error': f"{tool_name} timed out after {spec.timeout:g}s"
+                }
+            finally:
+                current_tool.reset(token)
+
+    def shutdown(self):
+        for executor in self.executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
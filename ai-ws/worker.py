@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Tool worker process for the AI WebSocket service.
+
+Consumes jobs from the durable tool queue so PDF and LLM work runs outside the
+websocket process. Run one or more alongside the server with
+TOOL_WORKER_MODE=external:
+
+    uv run python worker.py --concurrency 4
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+# Add the current directory to Python path
+current_dir = Path(__file__).parent
+sys.path.insert(0, str(current_dir))
+
+# Load environment variables before main reads its configuration
+load_dotenv(current_dir / '.env')
+
+import main  # noqa: E402
+from job_queue import ToolWorker  # noqa: E402
+
+logger = logging.getLogger("worker")
+
+async def run(concurrency: int, poll_interval: float, drain_timeout: float):
+    worker = ToolWorker(
+        main.tool_queue,
+        main.execute_tool,
+        worker_id=f"{socket.gethostname()}-{os.getpid()}",
+        concurrency=concurrency,
+        poll_interval=poll_interval,
+        tool_limits=main.tool_registry.concurrency_limits()
+    )
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    worker_task = asyncio.create_task(worker.run())
+    await stop.wait()
+
+    logger.info(f"Stopping tool worker, waiting up to {drain_timeout:.0f}s for running jobs")
+    await worker.stop(timeout=drain_timeout)
+    worker_task.cancel()
+    await asyncio.gather(worker_task, return_exceptions=True)
+    main.tool_registry.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a tool worker for the AI WebSocket service")
+    parser.add_argument("--concurrency", type=int, default=main.TOOL_WORKER_CONCURRENCY, help="Jobs run concurrently by this worker")
+    parser.add_argument("--poll-interval", type=float, default=main.TOOL_QUEUE_POLL_INTERVAL, help="Seconds between queue polls when idle")
+    parser.add_argument("--drain-timeout", type=float, default=60.0, help="Seconds to wait for running jobs on shutdown")
+    args = parser.parse_args()
+
+    print(f"🔧 Starting tool worker (queue: {main.TOOL_QUEUE_PATH})")
+    asyncio.run(run(args.concurrency, args.poll_interval, args.drain_timeout))
@@ -0,0 +1,249 @@
+"""
+Approval-flow engine backed by SQLite.
+
+create_approval_flow turns the free-text ``approvers`` and ``steps`` parameters
+into a staged step graph: steps run in order, and a step that names several
+approvers becomes one parallel stage that completes once all of them approve.
+Workflows are keyed by id and steps are indexed by approver, so looking up a
+flow, an approver's inbox or the step a decision applies to never scans
+other flows.
+"""
+import logging
+import re
+import sqlite3
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+FLOW_PENDING = "pending"
+FLOW_APPROVED = "approved"
+FLOW_REJECTED = "rejected"
+
+STEP_PENDING = "pending"
+STEP_APPROVED = "approved"
+STEP_REJECTED = "rejected"
+DECISIONS = {"approve": STEP_APPROVED, "reject": STEP_REJECTED}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workflows (
+    workflow_id TEXT PRIMARY KEY,
+    flow_name TEXT NOT NULL,
+    description TEXT,
+    client_id TEXT,
+    status TEXT NOT NULL,
+    current_stage INTEGER NOT NULL DEFAULT 0,
+    stage_count INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS workflow_steps (
+    workflow_id TEXT NOT NULL,
+    step_index INTEGER NOT NULL,
+    stage INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    approver TEXT,
+    approver_key TEXT,
+    status TEXT NOT NULL,
+    comment TEXT,
+    decided_at REAL,
+    PRIMARY KEY (workflow_id, step_index)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_steps_stage ON workflow_steps(workflow_id, stage, status);
+CREATE INDEX IF NOT EXISTS idx_steps_approver ON workflow_steps(approver_key, status);
+"""
+
+# Only list separators: "and"/"&" are part of names such as "Research and Development Lead"
+APPROVER_SPLIT_RE = re.compile(r"\s*[,;\n]\s*")
+STEP_SPLIT_RE = re.compile(r"\s*(?:\n+|;|->|=>|→|\bthen\b)\s*", re.IGNORECASE)
+# "1. Manager review 2. Finance sign-off" on a single line
+STEP_NUMBER_RE = re.compile(r"(?:^|\s)(?:step\s*)?\d+\s*[.):]\s+", re.IGNORECASE)
+STEP_BULLET_RE = re.compile(r"^(?:[-*•]\s*)+")
+
+class WorkflowError(ValueError):
+    """A decision that does not apply to the workflow's current state"""
+
+def approver_key(name: str) -> str:
+    return " ".join(name.lower().split())
+
+def is_participant(workflow: Dict, principal: str) -> bool:
+    """Whether principal created the workflow (its client_id) or is an approver on one of its steps"""
+    key = approver_key(principal)
+    return workflow["client_id"] == principal or any(
+        step["approver"] and approver_key(step["approver"]) == key for step in workflow["steps"]
+    )
+
+def parse_approvers(text: Optional[str]) -> List[str]:
+    """Split "Sales Manager, Finance; Legal" into distinct approver names"""
+    approvers = []
+    for part in APPROVER_SPLIT_RE.split(text or ""):
+        name = STEP_BULLET_RE.sub("", part).strip(" .")
+        if name and approver_key(name) not in {approver_key(a) for a in approvers}:
+            approvers.append(name)
+    return approvers
+
+def parse_steps(text: Optional[str]) -> List[str]:
+    """Split a step description on newlines, semicolons, arrows, "then" and 1./2./3. numbering"""
+    steps = []
+    for part in STEP_SPLIT_RE.split(text or ""):
+        for piece in STEP_NUMBER_RE.split(part):
+            name = STEP_BULLET_RE.sub("", piece).strip(" .,")
+            if name:
+                steps.append(name)
+    return steps
+
+def build_step_graph(approvers_text: Optional[str], steps_text: Optional[str]) -> List[Tuple[int, str, Optional[str]]]:
+    """Return (stage, step name, approver) rows; steps sharing a stage run in parallel"""
+    approvers = parse_approvers(approvers_text)
+    steps = parse_steps(steps_text)
+    patterns = [(a, re.compile(rf"\b{re.escape(a)}\b", re.IGNORECASE)) for a in approvers]
+    mentioned = [[a for a, pattern in patterns if pattern.search(step)] for step in steps]
+
+    if steps and len(steps) == len(approvers) and not any(mentioned):
+        # Parallel lists: the n-th step belongs to the n-th approver
+        mentioned = [[a] for a in approvers]
+
+    rows = []
+    assigned = set()
+    for stage, (step, step_approvers) in enumerate(zip(steps, mentioned)):
+        if not step_approvers:
+            rows.append((stage, step, None))
+        for approver in step_approvers:
+            rows.append((stage, step, approver))
+            assigned.add(approver)
+
+    # Every listed approver signs off, even if no step mentions them
+    stage = len(steps)
+    for approver in approvers:
+        if approver not in assigned:
+            rows.append((stage, f"Approval by {approver}", approver))
+            stage += 1
+
+    return rows or [(0, "Approval", None)]
+
+class WorkflowStore(SQLiteStore):
+    """Approval workflows stored in a local SQLite database (WAL mode, safe across processes)"""
+    def __init__(self, path: str):
+        super().__init__(path, SCHEMA)
+
+    def create(self, flow_name: str, description: Optional[str], approvers: Optional[str],
+               steps: Optional[str], client_id: Optional[str] = None) -> Dict:
+        """Parse the approvers and steps into a step graph and persist it"""
+        rows = build_step_graph(approvers, steps)
+        workflow_id = str(uuid.uuid4())
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO workflows (workflow_id, flow_name, description, client_id, status, current_stage, stage_count, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, 0, ?, ?, ?)",
+                (workflow_id, flow_name, description, client_id, FLOW_PENDING, rows[-1][0] + 1, now, now)
+            )
+            conn.executemany(
+                "INSERT INTO workflow_steps (workflow_id, step_index, stage, name, approver, approver_key, status) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(workflow_id, index, stage, name, approver, approver_key(approver) if approver else None, STEP_PENDING)
+                 for index, (stage, name, approver) in enumerate(rows)]
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get(workflow_id)
+
+    def get(self, workflow_id: str) -> Optional[Dict]:
+        conn = self._conn()
+        row = conn.execute("SELECT * FROM workflows WHERE workflow_id = ?", (workflow_id,)).fetchone()
+        if row is None:
+            return None
+        workflow = dict(row)
+        workflow["steps"] = [
+            {k: step[k] for k in ("step_index", "stage", "name", "approver", "status", "comment", "decided_at")}
+            for step in conn.execute(
+                "SELECT * FROM workflow_steps WHERE workflow_id = ? ORDER BY step_index", (workflow_id,)
+            )
+        ]
+        return workflow
+
+    def decide(self, workflow_id: str, approver: str, decision: str, comment: Optional[str] = None) -> Optional[Dict]:
+        """Record an approver's decision on their step in the current stage and advance the flow.
+
+        approver must be an authenticated identity, never a name taken from the request.
+        """
+        if decision not in DECISIONS:
+            raise WorkflowError(f"Decision must be one of: {', '.join(DECISIONS)}")
+        key = approver_key(approver)
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            workflow = conn.execute("SELECT * FROM workflows WHERE workflow_id = ?", (workflow_id,)).fetchone()
+            if workflow is None:
+                conn.execute("ROLLBACK")
+                return None
+            if workflow["status"] != FLOW_PENDING:
+                raise WorkflowError(f"Workflow is already {workflow['status']}")
+
+            stage = workflow["current_stage"]
+            # Unassigned steps can be decided by anyone listed on the flow (its creator if nobody is listed)
+            listed = conn.execute(
+                "SELECT COUNT(*) AS approvers, SUM(approver_key = ?) AS matches FROM workflow_steps "
+                "WHERE workflow_id = ? AND approver_key IS NOT NULL",
+                (key, workflow_id)
+            ).fetchone()
+            may_take_unassigned = bool(listed["matches"]) or (
+                not listed["approvers"] and workflow["client_id"] == approver
+            )
+            # The approver's own step first, otherwise an unassigned step in this stage
+            step = conn.execute(
+                "SELECT step_index FROM workflow_steps WHERE workflow_id = ? AND stage = ? AND status = ? "
+                "AND (approver_key = ? OR (approver_key IS NULL AND ?)) ORDER BY approver_key IS NULL, step_index LIMIT 1",
+                (workflow_id, stage, STEP_PENDING, key, may_take_unassigned)
+            ).fetchone()
+            if step is None:
+                raise WorkflowError(f"No step in stage {stage + 1} is waiting for {approver}")
+
+            conn.execute(
+                "UPDATE workflow_steps SET status = ?, approver = COALESCE(approver, ?), comment = ?, decided_at = ? "
+                "WHERE workflow_id = ? AND step_index = ?",
+                (DECISIONS[decision], approver, comment, now, workflow_id, step["step_index"])
+            )
+
+            status = FLOW_PENDING
+            if decision == "reject":
+                status = FLOW_REJECTED
+            elif conn.execute(
+                "SELECT 1 FROM workflow_steps WHERE workflow_id = ? AND stage = ? AND status = ? LIMIT 1",
+                (workflow_id, stage, STEP_PENDING)
+            ).fetchone() is None:
+                stage += 1
+                if stage >= workflow["stage_count"]:
+                    status = FLOW_APPROVED
+            conn.execute(
+                "UPDATE workflows SET status = ?, current_stage = ?, updated_at = ? WHERE workflow_id = ?",
+                (status, stage, now, workflow_id)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get(workflow_id)
+
+    def pending_for_approver(self, approver: str, limit: int = 100) -> List[Dict]:
+        """Steps currently waiting on an approver (their stage is the active one)"""
+        rows = self._conn().execute(
+            "SELECT w.workflow_id, w.flow_name, s.step_index, s.stage, s.name, w.created_at "
+            "FROM workflow_steps s JOIN workflows w ON w.workflow_id = s.workflow_id "
+            "WHERE s.approver_key = ? AND s.status = ? AND w.status = ? AND w.current_stage = s.stage "
+            "ORDER BY w.created_at LIMIT ?",
+            (approver_key(approver), STEP_PENDING, FLOW_PENDING, limit)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self) -> Dict[str, int]:
+        rows = self._conn().execute("SELECT status, COUNT(*) AS count FROM workflows GROUP BY status").fetchall()
+        return {row["status"]: row["count"] for row in rows}